@@ -0,0 +1,207 @@
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+import tty
+
+import numpy as np
+
+import socketflaskaudio as sfa
+
+# Emulator ESP32 pe un pseudo-terminal: persoane simulate se plimba prin camera, iar cadrele au exact formatul
+# din transmitData() din esp32.ino (sau formatul binar COBS cu --binary), terminate ca de Serial.println.
+# Backend-ul se porneste cu SERIAL_PORT=<pty> ca sa citeasca de aici in loc de /dev/ttyUSB0.
+
+# Senzorii ca in detect_people: dreapta, stanga, fata, spate, fiecare in centrul peretelui, orientat spre interior
+SENSOR_POSES = [((sfa.ROOM_WIDTH, sfa.ROOM_HEIGHT / 2), (-1.0, 0.0)), ((0.0, sfa.ROOM_HEIGHT / 2), (1.0, 0.0)),
+                ((sfa.ROOM_WIDTH / 2, 0.0), (0.0, 1.0)), ((sfa.ROOM_WIDTH / 2, sfa.ROOM_HEIGHT), (0.0, -1.0))]
+SENSOR_BEAM_DEG = 15.0  # jumatate din unghiul conului HC-SR04
+MIN_DISTANCE = 10  # ca MIN_DISTANCE din esp32.ino
+MARGIN = 30.0
+
+class Walker:
+    # o persoana care merge cu viteza constanta intre puncte; fara puncte date, le alege la intamplare
+    def __init__(self, rng, speed, waypoints=None):
+        self.rng = rng
+        self.speed = speed
+        self.waypoints = [tuple(map(float, point)) for point in waypoints] if waypoints else None
+        self.index = 0
+        self.position = np.array(self.waypoints[0] if self.waypoints else self.random_point())
+        self.velocity = np.zeros(2)
+        self.target = np.array(self.next_target())
+
+    def random_point(self):
+        return (self.rng.uniform(MARGIN, sfa.ROOM_WIDTH - MARGIN), self.rng.uniform(MARGIN, sfa.ROOM_HEIGHT - MARGIN))
+
+    def next_target(self):
+        if not self.waypoints:
+            return self.random_point()
+        self.index = (self.index + 1) % len(self.waypoints)
+        return self.waypoints[self.index]
+
+    def step(self, dt):
+        offset = self.target - self.position
+        distance = float(np.hypot(*offset))
+        if distance <= self.speed * dt:
+            self.position = self.target.copy()
+            self.target = np.array(self.next_target())
+            offset = self.target - self.position
+            distance = float(np.hypot(*offset))
+        self.velocity = offset / distance * self.speed if distance > 0 else np.zeros(2)
+        self.position = self.position + self.velocity * dt
+
+class CircleWalker(Walker):
+    def __init__(self, rng, speed, phase):
+        self.radius = min(sfa.ROOM_WIDTH, sfa.ROOM_HEIGHT) / 2 - MARGIN
+        self.angle = phase
+        super().__init__(rng, speed, [self.point()])
+
+    def point(self):
+        return (sfa.ROOM_WIDTH / 2 + self.radius * math.cos(self.angle), sfa.ROOM_HEIGHT / 2 + self.radius * math.sin(self.angle))
+
+    def step(self, dt):
+        self.angle += self.speed / self.radius * dt
+        previous = self.position
+        self.position = np.array(self.point())
+        self.velocity = (self.position - previous) / dt if dt > 0 else np.zeros(2)
+
+def create_walkers(trajectory, people, speed, rng):
+    if trajectory == 'random':
+        return [Walker(rng, speed) for _ in range(people)]
+    if trajectory == 'circle':
+        return [CircleWalker(rng, speed, 2 * math.pi * i / max(people, 1)) for i in range(people)]
+    # fisier JSON: {"people": [{"waypoints": [[x, y], ...], "speed": 60}, ...]}
+    with open(trajectory, 'r', encoding='utf-8') as f:
+        script = json.load(f)
+    return [Walker(rng, float(person.get('speed', speed)), person['waypoints']) for person in script['people']]
+
+def measure_distances(positions):
+    # ecoul cel mai apropiat din conul fiecarui senzor, -1 fara ecou, ca measureDistance()
+    distances = []
+    for (origin, axis) in SENSOR_POSES:
+        best = -1.0
+        for x, y in positions:
+            dx, dy = x - origin[0], y - origin[1]
+            distance = math.hypot(dx, dy)
+            if MIN_DISTANCE <= distance <= sfa.MAX_DISTANCE and (dx * axis[0] + dy * axis[1]) >= distance * math.cos(math.radians(SENSOR_BEAM_DEG)):
+                best = distance if best < 0 else min(best, distance)
+        distances.append(best)
+    return distances
+
+def json_frame(positions, velocities, confidence, distances, millis):
+    # aceleasi zecimale ca POSITION_PRECISION, VELOCITY_PRECISION, DISTANCE_PRECISION si String(confidence, 1)
+    p = ",".join(f"{x:.1f},{y:.1f}" for x, y in positions)
+    v = ",".join(f"{vx:.2f},{vy:.2f}" for vx, vy in velocities)
+    f = ",".join(f"{c:.1f}" for c in confidence)
+    d = ",".join(f"{distance:.0f}" for distance in distances)
+    return f'{{"c":{len(positions)},"p":[{p}],"d":[{d}],"v":[{v}],"f":[{f}],"t":{millis}}}\r\n'.encode()
+
+def debug_lines(positions, velocities, confidence):
+    return b''.join(f"[DEBUG] Persoana {i}: pos({x:.2f},{y:.2f}) vel({vx:.2f},{vy:.2f}) conf:{c:.2f}\r\n".encode()
+                    for i, ((x, y), (vx, vy), c) in enumerate(zip(positions, velocities, confidence)))
+
+def open_pty(link=None):
+    master, slave = os.openpty()
+    # fara ecou si fara traducerea '\n', ca un port USB-serial; capatul slave ramane deschis in emulator,
+    # ca pty-ul sa supravietuiasca reconectarilor backend-ului
+    tty.setraw(slave)
+    os.set_blocking(master, False)
+    path = os.ttyname(slave)
+    if link:
+        if os.path.islink(link):
+            os.unlink(link)
+        os.symlink(path, link)
+        path = link
+    return master, slave, path
+
+def run(args):
+    rng = random.Random(args.seed)
+    noise = np.random.default_rng(args.seed)
+    walkers = create_walkers(args.trajectory, args.people, args.speed, rng)
+    master, slave, path = open_pty(args.link)
+    print(f"ESP32 emulat pe {path}: porniti backend-ul cu SERIAL_PORT={path}", flush=True)
+    stats = {'frames': 0, 'bytes': 0, 'dropped_bytes': 0, 'overrun_bytes': 0, 'debug_lines': 0}
+
+    def send(data):
+        if args.drop > 0:
+            keep = noise.random(len(data)) >= args.drop
+            stats['dropped_bytes'] += len(data) - int(keep.sum())
+            data = np.frombuffer(data, dtype=np.uint8)[keep].tobytes()
+        try:
+            written = os.write(master, data)
+        except BlockingIOError:
+            written = 0
+        # nimeni nu citeste si bufferul pty-ului e plin: octetii se pierd, ca la un UART fara flow control
+        stats['overrun_bytes'] += len(data) - written
+        stats['bytes'] += written
+
+    start = time.monotonic()
+    interval = 1.0 / args.rate
+    sent = 0
+    last_report = start
+    try:
+        send(b'{"status":"init","device":"esp32_tracker"}\r\n')
+        while args.duration is None or time.monotonic() - start < args.duration:
+            due = start + sent * interval
+            now = time.monotonic()
+            if due > now:
+                time.sleep(due - now)
+            for walker in walkers:
+                walker.step(interval)
+            positions = [tuple(walker.position + noise.normal(0, args.noise, 2)) for walker in walkers]
+            velocities = [tuple(walker.velocity) for walker in walkers]
+            confidence = [float(np.clip(0.9 + noise.normal(0, 0.05), 0.0, 1.0)) for _ in walkers]
+            distances = [d + noise.normal(0, args.noise) if d > 0 else d for d in measure_distances(positions)]
+            millis = int((due - start) * 1000)
+            if args.binary:
+                frame = sfa.encode_sensor_frame(distances, [c for point in positions for c in point],
+                                                [c for point in velocities for c in point], confidence, millis)
+            else:
+                frame = json_frame(positions, velocities, confidence, distances, millis)
+            if args.debug > 0 and rng.random() < args.debug:
+                frame += debug_lines(positions, velocities, confidence)
+                stats['debug_lines'] += len(walkers)
+            send(frame)
+            sent += 1
+            stats['frames'] = sent
+            if time.monotonic() - last_report >= 5.0:
+                last_report = time.monotonic()
+                print(json.dumps(stats), flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        os.close(master)
+        os.close(slave)
+        if args.link and os.path.islink(args.link):
+            os.unlink(args.link)
+    return stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Emulator ESP32 pe un pseudo-terminal pentru testarea ingest-ului serial")
+    parser.add_argument('--rate', type=float, default=2.0, help="cadre pe secunda (firmware-ul real: 2)")
+    parser.add_argument('--people', type=int, default=2, help="numarul de persoane pentru traiectoriile generate")
+    parser.add_argument('--trajectory', default='random', help="'random', 'circle' sau un fisier JSON cu puncte de trecere")
+    parser.add_argument('--speed', type=float, default=60.0, help="viteza de mers in cm/s")
+    parser.add_argument('--noise', type=float, default=2.0, help="deviatia standard a zgomotului pe pozitii si distante, cm")
+    parser.add_argument('--drop', type=float, default=0.0, help="probabilitatea de pierdere a fiecarui octet")
+    parser.add_argument('--debug', type=float, default=0.0, help="probabilitatea ca un cadru sa fie urmat de linii [DEBUG]")
+    parser.add_argument('--binary', action='store_true', help="cadre binare COBS in loc de JSON")
+    parser.add_argument('--duration', type=float, default=None, help="secunde; implicit pana la Ctrl+C")
+    parser.add_argument('--link', default=None, help="link simbolic stabil catre pty, ex. /tmp/ttyESP32")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+    if args.rate <= 0 or not 0 <= args.drop < 1:
+        parser.error("--rate trebuie sa fie pozitiv si --drop intre 0 si 1")
+    try:
+        stats = run(args)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Eroare: {e}", file=sys.stderr)
+        return 1
+    print(json.dumps(stats), flush=True)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,112 @@
+import argparse
+import json
+import logging
+import sys
+import time
+
+import socketflaskaudio as sfa
+
+# Randare offline: un WAV de intrare si o inregistrare a cadrelor JSON de la ESP32 trec prin acelasi lant
+# apply_sensor_frame -> detect_people -> adjust_time_alignment -> process_binaural_audio ca in aplicatie,
+# fara placa de sunet si cat de repede permite procesorul.
+
+def load_trace(path, frame_interval):
+    # o linie = un cadru JSON asa cum il trimite ESP32; liniile [DEBUG] si cele invalide se ignora.
+    # Momentul fiecarui cadru vine din campul "t" (ms de la pornirea ESP32), relativ la primul cadru.
+    frames = []
+    first = None
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        for line in f:
+            line = line.strip()
+            if not line.startswith('{'):
+                continue
+            try:
+                frame = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            stamp = frame.get('t')
+            if isinstance(stamp, (int, float)) and stamp > 0:
+                if first is None:
+                    first = stamp
+                at = (stamp - first) / 1000
+            else:
+                at = frames[-1][0] + frame_interval if frames else 0.0
+            frames.append((at, frame))
+    return frames
+
+def render(input_path, trace_path, output_path, frame_interval=0.1):
+    trace = load_trace(trace_path, frame_interval)
+    backend = sfa.FileAudioBackend(input_path, loop=False, speed=0, output_path=output_path)
+    processor = sfa.AudioProcessor(backend)
+    block = processor.block_size
+    # iesirea are lungimea intrarii plus coada lantului (look-ahead-ul limitatorului, convolutia), nu blocuri intregi
+    total = len(backend.data) + processor.chain.latency()
+    position = 0
+    applied = 0
+    sensor_time = 0.0
+    start = time.perf_counter()
+    try:
+        while position < total:
+            now = position / sfa.RATE
+            sensor_start = time.perf_counter()
+            while applied < len(trace) and trace[applied][0] <= now:
+                sfa.apply_sensor_frame(trace[applied][1])
+                applied += 1
+            sensor_time += time.perf_counter() - sensor_start
+            data_out = processor.process_binaural_audio(processor.stream_in.read(block))
+            processor.stream_out.write(data_out[:min(block, total - position) * sfa.OUTPUT_CHANNELS * 2])
+            position += block
+    finally:
+        elapsed = time.perf_counter() - start
+        processor.cleanup()
+        backend.terminate()
+    audio_s = len(backend.data) / sfa.RATE
+    return {
+        'input': input_path,
+        'output': output_path,
+        'audio_s': audio_s,
+        'wall_s': elapsed,
+        'realtime_factor': audio_s / elapsed if elapsed > 0 else float('inf'),
+        'blocks': position // block,
+        'block_size': block,
+        'sensor_frames': applied,
+        'sensor_s': sensor_time,
+        'stages': processor.chain.info()['stages']
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Randare offline, mai rapida decat timpul real, a lantului binaural")
+    parser.add_argument('input', help="WAV de intrare (16 biti) sau .npy")
+    parser.add_argument('trace', help="cadre JSON de la ESP32, cate unul pe linie")
+    parser.add_argument('output', help="WAV sau .npy de iesire")
+    parser.add_argument('--block', type=int, default=sfa.CHUNK, help="cadre per bloc (implicit CHUNK)")
+    parser.add_argument('--hrir', default=None, help="fisier HRIR pentru etapa de convolutie")
+    parser.add_argument('--frame-interval', type=float, default=0.1,
+                        help="secunde intre cadrele fara camp 't' (implicit 0.1)")
+    parser.add_argument('--json', action='store_true', help="raportul complet ca JSON")
+    parser.add_argument('--verbose', action='store_true', help="pastreaza log-urile de debug ale aplicatiei")
+    args = parser.parse_args(argv)
+
+    if not args.verbose:
+        sfa.log.setLevel(logging.WARNING)
+    sfa.CHUNK = args.block
+    if args.hrir:
+        sfa.HRIR_FILE = args.hrir
+    try:
+        report = render(args.input, args.trace, args.output, args.frame_interval)
+    except (OSError, ValueError) as e:
+        print(f"Eroare: {e}", file=sys.stderr)
+        return 1
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+    print(f"Redat {report['audio_s']:.2f} s audio in {report['wall_s']:.2f} s: "
+          f"{report['realtime_factor']:.1f}x timp real ({report['blocks']} blocuri de {report['block_size']} cadre)")
+    print(f"Cadre senzor aplicate: {report['sensor_frames']} ({report['sensor_s'] * 1000:.1f} ms)")
+    for stage in report['stages']:
+        state = 'activ' if stage['enabled'] and not stage['bypass'] else 'ocolit'
+        print(f"  {stage['name']} ({state}): medie {stage['avg_ms']} ms, max {stage['max_ms']} ms, {stage['calls']} apeluri")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
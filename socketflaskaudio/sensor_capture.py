@@ -0,0 +1,126 @@
+import argparse
+import functools
+import json
+import logging
+import sys
+import time
+
+import serial
+
+import socketflaskaudio as sfa
+
+# Capturi ale fluxului serial de la ESP32: "record" scrie octetii bruti de pe port intr-o captura, "bench" o
+# reda prin acelasi lant ca read_serial (SerialFramer -> decode_serial_frame -> apply_sensor_frame, cu
+# detect_people si adjust_time_alignment) si masoara cate cadre pe secunda sustine.
+
+def record(port, output, seconds=None, baud=sfa.BAUD_RATE):
+    recorder = sfa.SerialRecorder(output)
+    start = time.monotonic()
+    try:
+        with serial.Serial(port=port, baudrate=baud, timeout=0.1) as ser:
+            while seconds is None or time.monotonic() - start < seconds:
+                data = ser.read(ser.in_waiting or 1)
+                if data:
+                    recorder.write(data)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        recorder.close()
+    return {'port': port, 'output': output, 'seconds': time.monotonic() - start, 'records': recorder.records, 'bytes': recorder.bytes}
+
+def timed(totals, name, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            totals[name] += time.perf_counter() - start
+    return wrapper
+
+def bench(path, speed=0.0, read_size=4096):
+    totals = {'framing': 0.0, 'decode': 0.0, 'apply': 0.0, 'detect_people': 0.0, 'adjust_time_alignment': 0.0}
+    original = sfa.detect_people, sfa.adjust_time_alignment
+    sfa.detect_people = timed(totals, 'detect_people', original[0])
+    sfa.adjust_time_alignment = timed(totals, 'adjust_time_alignment', original[1])
+    source = sfa.ReplaySerial(path, speed=speed, loop=False, timeout=0.0 if speed <= 0 else 0.05)
+    framer = sfa.SerialFramer()
+    frames = 0
+    start = time.perf_counter()
+    try:
+        while not source.finished:
+            data = source.read(read_size)
+            framing_start = time.perf_counter()
+            batch = framer.feed(data)
+            totals['framing'] += time.perf_counter() - framing_start
+            for frame in batch:
+                decode_start = time.perf_counter()
+                try:
+                    values = sfa.decode_serial_frame(frame)
+                except ValueError:
+                    framer.stats['invalid_frames'] += 1
+                    continue
+                finally:
+                    totals['decode'] += time.perf_counter() - decode_start
+                apply_start = time.perf_counter()
+                sfa.apply_sensor_frame(values)
+                totals['apply'] += time.perf_counter() - apply_start
+                frames += 1
+    finally:
+        elapsed = time.perf_counter() - start
+        source.close()
+        sfa.detect_people, sfa.adjust_time_alignment = original
+    # apply include detect_people si adjust_time_alignment; restul este actualizarea sensor_data si log-urile
+    totals['apply'] -= totals['detect_people'] + totals['adjust_time_alignment']
+    return {
+        'capture': path,
+        'speed': speed,
+        'records': source.records,
+        'capture_s': source.capture_ns / 1e9,
+        'wall_s': elapsed,
+        'frames': frames,
+        'frames_per_s': frames / elapsed if elapsed > 0 else float('inf'),
+        'stages_us': {name: round(total / frames * 1e6, 2) if frames else 0.0 for name, total in totals.items()},
+        'framer': framer.stats
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inregistrare si redare a fluxului serial de la ESP32")
+    commands = parser.add_subparsers(dest='command', required=True)
+    record_parser = commands.add_parser('record', help="inregistreaza octetii bruti de pe un port serial")
+    record_parser.add_argument('port', help="portul serial, ex. /dev/ttyUSB0")
+    record_parser.add_argument('output', help="fisierul de captura (se adauga la sfarsit daca exista)")
+    record_parser.add_argument('--seconds', type=float, default=None, help="durata; implicit pana la Ctrl+C")
+    record_parser.add_argument('--baud', type=int, default=sfa.BAUD_RATE)
+    bench_parser = commands.add_parser('bench', help="reda o captura prin lantul de ingest si masoara debitul")
+    bench_parser.add_argument('capture', help="fisierul de captura")
+    bench_parser.add_argument('--speed', type=float, default=0.0,
+                              help="1 = timp real, N = de N ori mai repede, 0 = cat de repede se poate (implicit)")
+    bench_parser.add_argument('--json', action='store_true', help="raportul complet ca JSON")
+    bench_parser.add_argument('--verbose', action='store_true', help="pastreaza log-urile de debug ale aplicatiei")
+    args = parser.parse_args(argv)
+
+    if not getattr(args, 'verbose', False):
+        sfa.log.setLevel(logging.WARNING)
+    try:
+        if args.command == 'record':
+            report = record(args.port, args.output, args.seconds, args.baud)
+        else:
+            report = bench(args.capture, args.speed)
+    except (OSError, ValueError, serial.SerialException) as e:
+        print(f"Eroare: {e}", file=sys.stderr)
+        return 1
+    if args.command == 'record' or args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+    print(f"Redat {report['records']} inregistrari ({report['capture_s']:.2f} s de captura) in {report['wall_s']:.2f} s: "
+          f"{report['frames']} cadre, {report['frames_per_s']:.0f} cadre/s")
+    for name, micros in report['stages_us'].items():
+        print(f"  {name}: {micros} us/cadru")
+    stats = report['framer']
+    print(f"Cadre JSON {stats['frames']}, binare {stats['binary_frames']}, invalide {stats['invalid_frames']}, "
+          f"linii [DEBUG] {stats['debug_lines']}, octeti aruncati {stats['discarded_bytes']}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
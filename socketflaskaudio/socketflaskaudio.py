@@ -16,6 +16,20 @@ import atexit
 import psutil
 import subprocess
 import sys
+import os
+import functools
+import multiprocessing
+from multiprocessing import shared_memory
+import wave
+import re
+import struct
+import math
+import selectors
+import binascii
+try:
+    from scipy import signal as scipy_signal
+except ImportError:
+    scipy_signal = None
 
 # Configurare logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -31,24 +45,105 @@ FORMAT = pyaudio.paInt16
 CHANNELS = 2
 RATE = 44100
 CHUNK = 512
+MAX_DELAY_MS = 50
+# Iesire multicanal: cate o intrare pe difuzor/zona, cu pozitia in camera (cm) si canalul sursa sau
+# ponderile de mixaj din canalele de intrare, ex. {'name': 'zona1', 'position': [0, 0], 'mix': [0.5, 0.5]}.
+# None pastreaza difuzorul stereo de la SPEAKER_POSITION.
+OUTPUT_LAYOUT = None
+OUTPUT_CHANNELS = len(OUTPUT_LAYOUT) if OUTPUT_LAYOUT else CHANNELS
+MAX_DELAY_SAMPLES = int(MAX_DELAY_MS * RATE / 1000)
+FRACTIONAL_DELAY_ORDER = 3  # ordinul interpolarii Lagrange, 0 = delay rotunjit la esantion
+FRACTIONAL_DELAY_STEPS = 1024  # rezolutia fractiunii de esantion pentru cache-ul de coeficienti
+DELAY_TRANSITION = 'ramp'  # 'jump', 'ramp' sau 'crossfade' la schimbarea delay-ului
+DELAY_TRANSITION_SAMPLES = 1024
+EQ_BANDS = []  # benzi EQ de camera, ex. {'type': 'peaking', 'freq': 120, 'gain_db': -4, 'q': 1.4}
+EQ_TYPES = ('peaking', 'lowshelf', 'highshelf', 'lowpass', 'highpass', 'notch')
+LIMITER_CEILING_DB = -1.0  # dBFS fata de 32767
+LIMITER_ATTACK_MS = 2.0  # egal cu look-ahead-ul, deci si cu latenta adaugata
+LIMITER_MAX_ATTACK_MS = 10.0
+LIMITER_RELEASE_MS = 150.0  # timpul in care castigul revine cu 10 dB
+HRIR_FILE = None  # fisier .npz cu HRIR-uri ('azimuths' + 'hrir') sau chei in stil SOFA ('SourcePosition' + 'Data.IR')
+AUDIO_IO_MODE = 'blocking'  # 'blocking' (read/write in thread-ul audio) sau 'callback' (stream_callback PyAudio)
+CALLBACK_DSP = 'worker'  # in modul callback: DSP in callback-ul de iesire ('callback') sau intr-un thread dedicat ('worker')
+AUDIO_RING_BLOCKS = 8
+AUDIO_RING_PREFILL = 2  # blocuri de liniste puse in avans in coada citita de iesire
+ADAPTIVE_BUFFER = False  # frames_per_buffer variabil intre ADAPTIVE_MIN_CHUNK si ADAPTIVE_MAX_CHUNK, dupa xrun-uri
+ADAPTIVE_MIN_CHUNK = 64  # si partitia convolutiei HRIR in modul adaptiv
+ADAPTIVE_MAX_CHUNK = 1024
+ADAPTIVE_HIGH_LOAD = 0.7  # fractiune din durata blocului consumata de DSP peste care blocul creste
+ADAPTIVE_LOW_LOAD = 0.3  # sub aceasta fractiune, fara xrun-uri, blocul poate scadea
+ADAPTIVE_SETTLE_S = 0.5  # xrun-urile imediat dupa redeschiderea stream-urilor nu se iau in calcul
+ADAPTIVE_DOWN_HOLD_S = 30.0  # functionare fara xrun-uri necesara inainte de a micsora blocul
+ADAPTIVE_MAX_HOLD_S = 600.0
+AUDIO_EVENT_TYPES = ('input_overflow', 'output_underrun', 'ring_overflow', 'ring_underrun', 'stream_restart', 'deadline_miss')
+AUDIO_HEALTH_EVENTS = 200  # ultimele evenimente de glitch pastrate cu timestamp
+AUDIO_CPU_AFFINITY = None  # core-urile rezervate thread-urilor audio, ex. {3}; None lasa planificatorul sa aleaga
+AUDIO_SCHED_POLICY = None  # 'fifo' sau 'rr' cere prioritate real-time (necesita CAP_SYS_NICE sau rtprio), None = normal
+AUDIO_SCHED_PRIORITY = 70
+AUDIO_PROCESS = False  # AudioProcessor intr-un proces separat (spawn), fara GIL comun cu Flask, serialul si log-urile
+AUDIO_PROCESS_START_TIMEOUT_S = 15.0
+AUDIO_METER_SLOTS = 16  # sloturi in inelul de metering partajat cu procesul web
+CONTROL_READ_RETRIES = 4  # incercari de citire seqlock pe bloc, apoi se pastreaza parametrii precedenti
+RECOVERY_BASE_DELAY_S = 0.005  # prima pauza intre incercarile de redeschidere a unui stream, apoi se dubleaza
+RECOVERY_MAX_DELAY_S = 1.0
+RECOVERY_INCIDENTS = 50
+AUDIO_BACKEND = 'pyaudio'  # 'pyaudio', 'file' (WAV sau .npy) ori 'synthetic'
+AUDIO_BACKEND_SPEED = 1.0  # backend-uri virtuale: 1.0 = timp real, N = de N ori mai repede, 0 = fara asteptare
+AUDIO_INPUT_FILE = None
+AUDIO_INPUT_LOOP = True  # la sfarsitul fisierului reia de la inceput, altfel da liniste si marcheaza finished
+AUDIO_OUTPUT_FILE = None  # .wav sau .npy in care backend-urile virtuale salveaza iesirea
+SYNTHETIC_SIGNAL = {'type': 'sine', 'freq': 440.0, 'amplitude': 0.3}  # 'sine', 'sweep', 'noise', 'impulse', 'silence'
+DRIFT_COMPENSATION = False  # resampling adaptiv intre ceasul Loopback si ceasul DAC-ului
+DRIFT_MAX_PPM = 300.0
+DRIFT_KP = 0.6  # ppm per cadru de eroare fata de nivelul tinta
+DRIFT_KI = 0.01  # ppm per cadru*secunda
+DRIFT_SMOOTHING_S = 10.0  # constanta de timp a mediei nivelului de umplere
+DRIFT_SETTLE_S = 30.0  # dupa amorsarea resampler-ului, nivelul mediu din acest moment devine tinta; minim 3 x DRIFT_SMOOTHING_S
 LOOPBACK_DEVICE_INDEX = None
 IQAUDIO_DEVICE_INDEX = None
+INPUT_DEVICE_MATCH = 'Loopback'  # parte din numele dispozitivului PortAudio sau ID-ul placii ALSA
+OUTPUT_DEVICE_MATCH = 'IQAUDIO'
+ASOUND_CARDS_PATH = '/proc/asound/cards'
+DEVICE_POLL_S = 2.0  # cat de des se verifica placile ALSA pentru hot-plug
 p_proc = None
 
 # Configurare port serial
 SERIAL_PORT = None
 BAUD_RATE = 115200
+SERIAL_BUFFER_MAX = 16384  # octeti fara terminator de cadru dupa care bufferul serial se goleste
+SENSOR_FRAME_VERSION = 1
+SENSOR_FRAME_HEADER = struct.Struct('<BBI')  # versiune, numar persoane, t (ms de la pornirea ESP32)
+SENSOR_FRAME_CRC = struct.Struct('<H')
+SENSOR_FRAME_VALUE = np.dtype('<f4')
+SERIAL_DELIMITERS = re.compile(rb'[\n\x00]')
+SERIAL_CAPTURE_FILE = None  # daca e setat, octetii seriali bruti se adauga aici cu timestamp monoton
+SERIAL_CAPTURE_MAGIC = b'SFACAP\x00\x01'
+SERIAL_CAPTURE_RECORD = struct.Struct('<QI')  # time.monotonic_ns() la citire, numar de octeti
+SERIAL_REPLAY_FILE = None  # daca e setat, read_serial citeste dintr-o captura in locul portului serial
+SERIAL_REPLAY_SPEED = 1.0  # 1.0 = timp real, N = de N ori mai repede, 0 = fara asteptare
+SERIAL_REPLAY_LOOP = False
+SERIAL_REPLAY_MAX_GAP_S = 5.0  # pauzele mai lungi din captura (ex. intre doua porniri) se scurteaza la atat
+# Mai multe ESP32 in aceeasi camera, fiecare cu pozitia si rotatia sistemului lui de coordonate in camera, ex.
+# {'id': 'nord', 'port': '/dev/ttyUSB0', 'x': 0, 'y': 0, 'rotation': 0}; lista goala = un singur ESP32 prin read_serial
+SENSOR_NODES = []
+SENSOR_NODE_TIMEOUT_S = 2.0  # cadrele mai vechi de atat nu mai intra in fuziune
+FUSION_RADIUS = 50.0  # cm; persoane vazute de noduri diferite mai aproape de atat sunt aceeasi persoana
+DISTANCE_CONFIDENCE = 0.3  # increderea unei pozitii deduse doar din distante, fara tracking pe ESP32
 ser = None
 
 # Parametri globali
 params = {
     'delay_l': 0,
     'delay_r': 0,
+    'gain_l': 1.0,
+    'gain_r': 1.0,
+    'azimuth': 0.0,
+    'delays': [0.0] * OUTPUT_CHANNELS,
+    'gains': [1.0] * OUTPUT_CHANNELS,
     'running': False
 }
 
 sensor_data = {"distances": [-1.0] * 4, "positions": [], "velocities": [], "confidence": [], "timestamp": 0}
-buffer = ""
 
 MAX_DISTANCE = 400
 ROOM_WIDTH = 400
@@ -56,9 +151,15 @@ ROOM_HEIGHT = 400
 SPEAKER_POSITION = [ROOM_WIDTH / 2, ROOM_HEIGHT / 2]
 SPEAKER_POSITION_LOCK = threading.Lock()
 SPEAKER_WIDTH = 50
+HEAD_RADIUS = 8.75  # cm, distanta de la centrul capului la fiecare ureche
+MIN_HEADING_SPEED = 5.0  # cm/s, sub aceasta viteza se considera ca persoana priveste spre difuzor
 
 sensor_history = [deque(maxlen=10) for _ in range(4)]
 people_positions = []
+people_alignment = []
+
+# Ordinea si starea etapelor DSP setate prin API, pastrate intre reporniri ale procesorului
+DSP_CHAIN_SETTINGS = {'order': None, 'stages': {}}
 
 AUDIO_QUEUE_IN = queue.Queue(maxsize=10)
 AUDIO_BUFFER_IN = deque(maxlen=5)
@@ -94,6 +195,11 @@ def log_debug(category, message):
     log.debug(log_entry)
 
 def find_serial_port():
+    # SERIAL_PORT din mediu (ex. pty-ul din esp32_emulator.py) sau din configurare are prioritate fata de cautare
+    configured = os.environ.get('SERIAL_PORT') or SERIAL_PORT
+    if configured:
+        log_debug("sensors", f"Port serial configurat: {configured}")
+        return configured
     ports = serial.tools.list_ports.comports()
     log_debug("general", f"Porturi disponibile: {[port.device for port in ports]}")
     for port in ports:
@@ -133,120 +239,1923 @@ def detect_people():
         log_debug("people", f"Persoane detectate din ESP32: {len(people_positions)}")
     else:
         log_debug("people", "Nicio pozitie primita de la ESP32, folosesc distanțe brute")
-        for i in range(4):
-            current_distance = distances[i]
-            if current_distance > 0 and current_distance < MAX_DISTANCE:
-                if i == 0: people_positions.append([ROOM_WIDTH - current_distance, ROOM_HEIGHT / 2])
-                elif i == 1: people_positions.append([current_distance, ROOM_HEIGHT / 2])
-                elif i == 2: people_positions.append([ROOM_WIDTH / 2, current_distance])
-                elif i == 3: people_positions.append([ROOM_WIDTH / 2, ROOM_HEIGHT - current_distance])
+        people_positions.extend(positions_from_distances(distances))
 
     if people_positions:
         avg_x = np.mean([pos[0] for pos in people_positions])
         avg_y = np.mean([pos[1] for pos in people_positions])
         log_debug("people", f"Persoana detectata, pozitie medie: ({avg_x:.1f}, {avg_y:.1f}) cm")
 
+def positions_from_distances(distances, width=ROOM_WIDTH, height=ROOM_HEIGHT):
+    # senzorii dreapta, stanga, fata, spate sunt in centrul peretilor si masoara spre interior
+    positions = []
+    for i in range(4):
+        current_distance = distances[i]
+        if current_distance > 0 and current_distance < MAX_DISTANCE:
+            if i == 0: positions.append([width - current_distance, height / 2])
+            elif i == 1: positions.append([current_distance, height / 2])
+            elif i == 2: positions.append([width / 2, current_distance])
+            elif i == 3: positions.append([width / 2, height - current_distance])
+    return positions
+
+def compute_ear_alignment(positions, velocities, speaker_pos):
+    # calcul vectorial pentru toate persoanele: drum difuzor stang -> urechea stanga, difuzor drept -> urechea dreapta
+    pos = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+    vel = np.zeros_like(pos)
+    measured = np.asarray(velocities, dtype=np.float64).reshape(-1, 2)[:len(pos)]
+    vel[:len(measured)] = measured
+    drivers = np.array([[speaker_pos[0] - SPEAKER_WIDTH / 2, speaker_pos[1]],
+                        [speaker_pos[0] + SPEAKER_WIDTH / 2, speaker_pos[1]]])
+
+    # orientarea capului: directia de deplasare, sau spre difuzor cand persoana sta pe loc
+    moving = np.hypot(vel[:, 0], vel[:, 1]) > MIN_HEADING_SPEED
+    facing = np.where(moving[:, None], vel, np.asarray(speaker_pos, dtype=np.float64) - pos)
+    norm = np.hypot(facing[:, 0], facing[:, 1])
+    norm[norm == 0] = 1.0
+    facing /= norm[:, None]
+    left_dir = np.stack([-facing[:, 1], facing[:, 0]], axis=1)
+    ears = np.stack([pos + HEAD_RADIUS * left_dir, pos - HEAD_RADIUS * left_dir], axis=1)
+
+    diff = drivers[None, :, :] - ears
+    paths = np.hypot(diff[..., 0], diff[..., 1])
+    # urechea mai apropiata se intarzie cu diferenta de drum, ca sunetul sa ajunga la ambele urechi deodata
+    delays = np.minimum((paths.max(axis=1, keepdims=True) - paths) / 34.3, MAX_DELAY_MS) * RATE / 1000
+    # nivel egalizat la urechi dupa legea inversului distantei, urechea mai indepartata ramane la 1.0
+    gains = paths / np.maximum(paths.max(axis=1, keepdims=True), 1e-6)
+    # azimutul difuzorului fata de directia privirii, in grade, pozitiv spre stanga (conventia SOFA)
+    to_speaker = np.asarray(speaker_pos, dtype=np.float64) - pos
+    azimuths = np.degrees(np.arctan2(facing[:, 0] * to_speaker[:, 1] - facing[:, 1] * to_speaker[:, 0],
+                                     facing[:, 0] * to_speaker[:, 0] + facing[:, 1] * to_speaker[:, 1]))
+    return paths, delays, gains, azimuths
+
+def compute_speaker_alignment(positions, speaker_positions):
+    # distanta de la fiecare persoana la fiecare difuzor/zona, calculata vectorial (persoane x canale)
+    pos = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+    speakers = np.asarray(speaker_positions, dtype=np.float64).reshape(-1, 2)
+    diff = speakers[None, :, :] - pos[:, None, :]
+    paths = np.hypot(diff[..., 0], diff[..., 1])
+    # difuzoarele mai apropiate se intarzie cu diferenta fata de cel mai indepartat, ca fronturile sa ajunga deodata
+    delays = np.minimum((paths.max(axis=1, keepdims=True) - paths) / 34.3, MAX_DELAY_MS) * RATE / 1000
+    gains = paths / np.maximum(paths.max(axis=1, keepdims=True), 1e-6)
+    return paths, delays, gains
+
+def build_output_routing(layout, input_channels):
+    positions = np.zeros((len(layout), 2))
+    mix = np.zeros((len(layout), input_channels), dtype=np.float32)
+    for i, speaker in enumerate(layout):
+        positions[i] = speaker['position']
+        if 'mix' in speaker:
+            if len(speaker['mix']) != input_channels:
+                raise ValueError(f"Difuzorul {i}: 'mix' trebuie sa aiba {input_channels} ponderi")
+            mix[i] = speaker['mix']
+        else:
+            mix[i, int(speaker.get('source', i % input_channels))] = 1.0
+    return positions, mix
+
+def adjust_multichannel_alignment():
+    global people_alignment
+    positions, _ = build_output_routing(OUTPUT_LAYOUT, CHANNELS)
+    paths, delays, gains = compute_speaker_alignment(people_positions, positions)
+    people_alignment = [{'paths': paths[i].tolist(), 'delays': delays[i].tolist(), 'gains': gains[i].tolist()}
+                        for i in range(len(paths))]
+    closest = int(np.argmin(paths.mean(axis=1)))
+    params['delays'] = [round(float(d), 3) for d in delays[closest]]
+    params['gains'] = [round(float(g), 4) for g in gains[closest]]
+    params['delay_l'], params['delay_r'] = params['delays'][0], params['delays'][min(1, OUTPUT_CHANNELS - 1)]
+    params['gain_l'], params['gain_r'] = params['gains'][0], params['gains'][min(1, OUTPUT_CHANNELS - 1)]
+    log_debug("people", f"Ajustare multicanal: delays={params['delays']} samples, gains={params['gains']}")
+
 def adjust_time_alignment():
-    global params
+    global params, people_alignment
     with SPEAKER_POSITION_LOCK:
         speaker_pos = SPEAKER_POSITION
     if not people_positions:
         params['delay_l'] = 0
         params['delay_r'] = 0
+        params['gain_l'] = 1.0
+        params['gain_r'] = 1.0
+        params['azimuth'] = 0.0
+        params['delays'] = [0.0] * OUTPUT_CHANNELS
+        params['gains'] = [1.0] * OUTPUT_CHANNELS
+        people_alignment = []
         log_debug("people", "Nicio persoana detectata, parametri resetati")
         return
+    if OUTPUT_LAYOUT:
+        adjust_multichannel_alignment()
+        return
 
-    closest_person = min(people_positions, key=lambda pos: ((pos[0] - speaker_pos[0])**2 + (pos[1] - speaker_pos[1])**2)**0.5)
-    person_x, person_y = closest_person
-    dist_cm = ((person_x - speaker_pos[0])**2 + (person_y - speaker_pos[1])**2)**0.5
+    paths, delays, gains, azimuths = compute_ear_alignment(people_positions, sensor_data["velocities"], speaker_pos)
+    people_alignment = [{'path_l': float(paths[i, 0]), 'path_r': float(paths[i, 1]),
+                         'delay_l': float(delays[i, 0]), 'delay_r': float(delays[i, 1]),
+                         'gain_l': float(gains[i, 0]), 'gain_r': float(gains[i, 1]),
+                         'azimuth': float(azimuths[i])} for i in range(len(paths))]
+    closest = int(np.argmin(paths.sum(axis=1)))
 
-    delay_ms = dist_cm / 34.3
-    max_delay_ms = 50
-    delay_samples = int(min(delay_ms, max_delay_ms) * RATE / 1000)
+    params['delay_l'] = round(float(delays[closest, 0]), 3)
+    params['delay_r'] = round(float(delays[closest, 1]), 3)
+    params['gain_l'] = round(float(gains[closest, 0]), 4)
+    params['gain_r'] = round(float(gains[closest, 1]), 4)
+    params['azimuth'] = round(float(azimuths[closest]), 1)
+    params['delays'] = [params['delay_l'], params['delay_r']]
+    params['gains'] = [params['gain_l'], params['gain_r']]
+    log_debug("people", f"Ajustare delay bazat pe distanta: delay_l={params['delay_l']:.3f} samples, delay_r={params['delay_r']:.3f} samples, "
+                        f"gain_l={params['gain_l']:.3f}, gain_r={params['gain_r']:.3f}, drum_l={paths[closest, 0]:.1f} cm, drum_r={paths[closest, 1]:.1f} cm")
 
-    params['delay_l'] = delay_samples
-    params['delay_r'] = delay_samples
-    log_debug("people", f"Ajustare delay bazat pe distanta: delay_l={params['delay_l']} samples, delay_r={params['delay_r']} samples, dist={dist_cm:.1f} cm")
+def frame_distances(data_dict):
+    distances = data_dict.get("d", [-1.0] * 4)
+    if isinstance(distances, np.ndarray):
+        return distances.tolist()
+    return [float(d) if d != 'eroare' else -1.0 for d in distances]
 
-def read_serial():
-    global sensor_data, buffer, ser
-    SERIAL_PORT = find_serial_port()
-    while True:
+def apply_sensor_frame(data_dict):
+    # un cadru de la ESP32 (JSON sau binar): actualizeaza sensor_data, apoi persoanele si alinierea temporala
+    sensor_data["distances"] = frame_distances(data_dict)
+    if isinstance(data_dict.get("p"), np.ndarray):
+        # cadru binar: vectorii devin liste dintr-un singur apel, fara conversii element cu element
+        sensor_data["positions"] = data_dict["p"].tolist()
+        sensor_data["velocities"] = data_dict["v"].tolist()
+        sensor_data["confidence"] = data_dict["f"].tolist()
+    else:
+        sensor_data["positions"] = [float(x) for pair in zip(data_dict.get("p", [])[::2], data_dict.get("p", [])[1::2]) for x in pair] if data_dict.get("p") else []
+        sensor_data["velocities"] = [float(v) for pair in zip(data_dict.get("v", [])[::2], data_dict.get("v", [])[1::2]) for v in pair] if data_dict.get("v") else []
+        sensor_data["confidence"] = data_dict.get("f", [0.0])
+    sensor_data["timestamp"] = data_dict.get("t", 0)
+    log_debug("sensors", f"Date senzor primite: {sensor_data}")
+    detect_people()
+    adjust_time_alignment()
+    publish_params()
+
+def cobs_encode(data):
+    out = bytearray()
+    for chunk in bytes(data).split(b'\x00'):
+        while len(chunk) >= 254:
+            out.append(255)
+            out += chunk[:254]
+            chunk = chunk[254:]
+        out.append(len(chunk) + 1)
+        out += chunk
+    return bytes(out)
+
+def cobs_decode(data):
+    # fiecare octet de cod devine pe loc zero-ul dinaintea blocului sau; dupa un bloc de 255 nu urmeaza zero
+    out = bytearray(data)
+    i, n = 0, len(data)
+    dropped = []
+    while i < n:
+        code = data[i]
+        if code == 0 or i + code > n:
+            raise ValueError("cadru COBS invalid")
+        out[i] = 0
+        i += code
+        if code == 255 and i < n:
+            dropped.append(i)
+    for index in reversed(dropped):
+        del out[index]
+    del out[0]
+    return out
+
+# Cadru binar v1, little-endian: antet SENSOR_FRAME_HEADER, apoi float32: d[4], p[2c], v[2c], f[c], la final
+# CRC-16/CCITT (binascii.crc_hqx, init 0xFFFF) peste tot ce il precede. Pe fir: 0x00 + COBS(cadru) + 0x00;
+# zero-ul de la inceput separa cadrul de liniile JSON/[DEBUG] si resincronizeaza dupa octeti pierduti.
+def encode_sensor_frame(distances, positions=(), velocities=(), confidence=(), timestamp=0):
+    count = len(confidence)
+    if len(distances) != 4 or len(positions) != 2 * count or len(velocities) != 2 * count:
+        raise ValueError("Cadrul are nevoie de 4 distante si 2 pozitii, 2 viteze, 1 incredere per persoana")
+    values = np.concatenate([np.asarray(part, dtype='<f4').ravel() for part in (distances, positions, velocities, confidence)])
+    body = SENSOR_FRAME_HEADER.pack(SENSOR_FRAME_VERSION, count, int(timestamp) & 0xFFFFFFFF) + values.tobytes()
+    return b'\x00' + cobs_encode(body + SENSOR_FRAME_CRC.pack(binascii.crc_hqx(body, 0xFFFF))) + b'\x00'
+
+@functools.lru_cache(maxsize=None)
+def sensor_frame_scale(count):
+    # zecimalele din transmitData(): DISTANCE_PRECISION, POSITION_PRECISION, VELOCITY_PRECISION, confidence 1
+    return np.repeat([1.0, 10.0, 100.0, 10.0], [4, 2 * count, 2 * count, count])
+
+def decode_sensor_frame(payload):
+    # aceleasi chei ca un cadru JSON, dar cu vectori numpy in loc de liste; valorile se rotunjesc vectorial la
+    # zecimalele cadrului JSON, ca ambele formate sa dea aceleasi numere mai departe
+    if len(payload) < SENSOR_FRAME_HEADER.size + SENSOR_FRAME_CRC.size:
+        raise ValueError("cadru binar prea scurt")
+    body = payload[:-SENSOR_FRAME_CRC.size]
+    crc, = SENSOR_FRAME_CRC.unpack_from(payload, len(body))
+    if binascii.crc_hqx(body, 0xFFFF) != crc:
+        raise ValueError("CRC invalid")
+    version, count, timestamp = SENSOR_FRAME_HEADER.unpack_from(body)
+    if version != SENSOR_FRAME_VERSION:
+        raise ValueError(f"versiune de cadru necunoscuta: {version}")
+    if len(body) != SENSOR_FRAME_HEADER.size + 4 * (4 + 5 * count):
+        raise ValueError(f"lungime {len(body)} nepotrivita pentru {count} persoane")
+    scale = sensor_frame_scale(count)
+    values = np.frombuffer(body, dtype=SENSOR_FRAME_VALUE, count=4 + 5 * count, offset=SENSOR_FRAME_HEADER.size) * scale
+    np.rint(values, out=values)
+    values /= scale
+    people = 4 + 2 * count
+    return {'c': count, 'd': values[:4], 'p': values[4:people], 'v': values[people:people + 2 * count],
+            'f': values[people + 2 * count:], 't': timestamp}
+
+def decode_serial_frame(frame):
+    # formatul se detecteaza pe fiecare cadru: 0x00 la inceput = binar COBS, altfel JSON
+    if frame[:1] == b'\x00':
+        return decode_sensor_frame(cobs_decode(frame[1:]))
+    return json.loads(frame)
+
+# Imparte fluxul serial in cadre pe un bytearray: linii JSON/[DEBUG] terminate de Serial.println si cadre binare
+# intre doi octeti 0x00 (COBS nu produce 0x00, dar poate produce '\n'). Fiecare octet este cautat o singura data,
+# iar cadrele complete se livreaza o singura data, fara decodare UTF-8; cele binare pastreaza 0x00 initial.
+# Un cadru mai lung decat max_buffer se arunca pana la urmatorul terminator, cu octetii numarati.
+class SerialFramer:
+    def __init__(self, max_buffer=SERIAL_BUFFER_MAX):
+        self.buffer = bytearray()
+        self.scan = 0
+        self.max_buffer = max_buffer
+        self.skipping = False
+        self.binary = False
+        self.stats = {'bytes': 0, 'frames': 0, 'binary_frames': 0, 'invalid_frames': 0, 'debug_lines': 0,
+                      'discarded_bytes': 0, 'overflows': 0}
+
+    def feed(self, data):
+        self.buffer += data
+        self.stats['bytes'] += len(data)
+        frames = []
+        start = 0
+        while True:
+            if self.binary:
+                end = self.buffer.find(b'\x00', self.scan)
+            else:
+                match = SERIAL_DELIMITERS.search(self.buffer, self.scan)
+                end = match.start() if match else -1
+            if end == -1:
+                break
+            self.scan = end + 1
+            if self.skipping:
+                self.skipping = self.binary = False
+                self.stats['discarded_bytes'] += end + 1 - start
+                start = end + 1
+                continue
+            if self.binary:
+                if end == start + 1:
+                    # doi de 0x00 la rand: sfarsitul cadrului precedent si inceputul celui curent
+                    start = end
+                    continue
+                self.binary = False
+                frames.append(bytes(self.buffer[start:end]))
+                self.stats['binary_frames'] += 1
+                start = end + 1
+                continue
+            if self.buffer[end] == 0:
+                self.stats['discarded_bytes'] += len(self.buffer[start:end].strip())
+                self.binary = True
+                start = end
+                continue
+            line = bytes(self.buffer[start:end]).strip()
+            start = end + 1
+            # cu un '\n' pierdut cadrul vine lipit dupa o linie [DEBUG] sau dupa zgomot; se cauta doar in linie
+            brace = line.find(b'{')
+            prefix = line[:brace] if brace != -1 else line
+            if prefix.startswith(b'[DEBUG]'):
+                self.stats['debug_lines'] += 1
+            elif prefix:
+                self.stats['discarded_bytes'] += len(prefix)
+            if brace != -1:
+                frames.append(line[brace:])
+                self.stats['frames'] += 1
+        # stergerea unui prefix dintr-un bytearray nu muta restul datelor
+        del self.buffer[:start]
+        self.scan = len(self.buffer)
+        if self.scan > self.max_buffer:
+            self.stats['overflows'] += 1
+            self.skipping = True
+            self.reset()
+        return frames
+
+    def reset(self):
+        # dupa o reconectare linia partiala din buffer nu mai are continuare
+        self.stats['discarded_bytes'] += len(self.buffer)
+        self.buffer.clear()
+        self.scan = 0
+
+SERIAL_FRAMER = SerialFramer()
+
+def describe_frame(frame):
+    return frame.hex(' ') if frame[:1] == b'\x00' else frame.decode('utf-8', errors='replace')
+
+# Captura append-only a fluxului serial brut: SERIAL_CAPTURE_MAGIC, apoi inregistrari SERIAL_CAPTURE_RECORD
+# urmate de octetii cititi. Timpul este cel monoton al gazdei, deci pauzele se reproduc fara ceasul ESP32.
+class SerialRecorder:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'a+b')
+        self.file.seek(0)
+        magic = self.file.read(len(SERIAL_CAPTURE_MAGIC))
+        if magic and magic != SERIAL_CAPTURE_MAGIC:
+            self.file.close()
+            raise ValueError(f"{path} nu este o captura seriala")
+        if not magic:
+            self.file.write(SERIAL_CAPTURE_MAGIC)
+        self.records = 0
+        self.bytes = 0
+
+    def write(self, data):
+        self.file.write(SERIAL_CAPTURE_RECORD.pack(time.monotonic_ns(), len(data)) + data)
+        self.file.flush()
+        self.records += 1
+        self.bytes += len(data)
+
+    def close(self):
+        self.file.close()
+
+# Sursa cu interfata folosita de read_serial din serial.Serial, peste o captura: inregistrarile sosesc dupa
+# pauzele originale impartite la speed (0 = imediat), citite pe rand din fisier, nu incarcate in memorie.
+class ReplaySerial:
+    def __init__(self, path, speed=None, loop=None, timeout=1.0):
+        self.port = path
+        self.speed = SERIAL_REPLAY_SPEED if speed is None else speed
+        self.loop = SERIAL_REPLAY_LOOP if loop is None else loop
+        self.timeout = timeout
         try:
-            if ser is None or not ser.is_open:
-                try:
-                    ser = serial.Serial(port=SERIAL_PORT, baudrate=BAUD_RATE, timeout=1, write_timeout=1)
-                    log_debug("sensors", f"Conectat la portul serial: {SERIAL_PORT}")
-                    ser.reset_input_buffer()
-                    ser.reset_output_buffer()
-                except serial.SerialException as e:
-                    log_debug("sensors", f"Eroare la conectare: {e}")
-                    time.sleep(5)
+            self.file = open(path, 'rb')
+        except OSError as e:
+            raise serial.SerialException(f"Nu pot deschide captura {path}: {e}")
+        if self.file.read(len(SERIAL_CAPTURE_MAGIC)) != SERIAL_CAPTURE_MAGIC:
+            self.file.close()
+            raise serial.SerialException(f"{path} nu este o captura seriala")
+        self.is_open = True
+        self.finished = False
+        self.records = 0
+        self.restart()
+
+    def restart(self):
+        self.file.seek(len(SERIAL_CAPTURE_MAGIC))
+        self.pending = bytearray()
+        self.started = time.monotonic()
+        self.capture_ns = 0
+        self.next_record = self.read_record()
+        self.last_stamp = self.next_record[0] if self.next_record else 0
+
+    def read_record(self):
+        header = self.file.read(SERIAL_CAPTURE_RECORD.size)
+        if len(header) < SERIAL_CAPTURE_RECORD.size:
+            return None
+        stamp, length = SERIAL_CAPTURE_RECORD.unpack(header)
+        data = self.file.read(length)
+        # o inregistrare trunchiata (aplicatia oprita in timpul scrierii) incheie captura
+        return (stamp, data) if len(data) == length else None
+
+    def due(self):
+        gap = min(max(self.next_record[0] - self.last_stamp, 0), int(SERIAL_REPLAY_MAX_GAP_S * 1e9))
+        return self.started + (self.capture_ns + gap) / 1e9 / self.speed
+
+    def arrive(self, limit):
+        now = time.monotonic()
+        while self.next_record is not None and (len(self.pending) < limit if self.speed <= 0 else self.due() <= now):
+            stamp, data = self.next_record
+            self.capture_ns += min(max(stamp - self.last_stamp, 0), int(SERIAL_REPLAY_MAX_GAP_S * 1e9))
+            self.last_stamp = stamp
+            self.pending += data
+            self.records += 1
+            self.next_record = self.read_record()
+
+    @property
+    def in_waiting(self):
+        self.arrive(1)
+        return len(self.pending)
+
+    def read(self, size=1):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            self.arrive(size)
+            if self.pending:
+                data = bytes(self.pending[:size])
+                del self.pending[:size]
+                return data
+            if self.next_record is None:
+                if self.loop:
+                    self.restart()
                     continue
-            data = ser.read(ser.in_waiting or 1).decode('utf-8', errors='ignore').strip()
-            if data:
-                buffer += data
-                while '{' in buffer:
-                    start = buffer.find('{')
-                    end = buffer.find('}', start) + 1
-                    if end <= start:
-                        next_start = buffer.find('{', start + 1)
-                        if next_start == -1:
-                            break
-                        end = next_start
-                    json_str = buffer[start:end].strip()
-                    if not json_str.endswith('}'):
-                        log_debug("sensors", f"JSON incomplet detectat: {json_str}")
-                        buffer = buffer[end:]
-                        continue
+                self.finished = True
+                time.sleep(max(0.0, deadline - time.monotonic()))
+                return b''
+            now = time.monotonic()
+            if now >= deadline:
+                return b''
+            time.sleep(max(min(self.due(), deadline) - now, 0.0))
+
+    def reset_input_buffer(self):
+        self.pending.clear()
+
+    def reset_output_buffer(self):
+        pass
+
+    def close(self):
+        self.is_open = False
+        self.file.close()
+
+def open_serial(port):
+    if SERIAL_REPLAY_FILE:
+        return ReplaySerial(SERIAL_REPLAY_FILE)
+    return serial.Serial(port=port, baudrate=BAUD_RATE, timeout=1, write_timeout=1)
+
+def read_serial():
+    global ser
+    SERIAL_PORT = SERIAL_REPLAY_FILE or find_serial_port()
+    recorder = None
+    if SERIAL_CAPTURE_FILE:
+        try:
+            recorder = SerialRecorder(SERIAL_CAPTURE_FILE)
+            log_debug("sensors", f"Inregistrez fluxul serial in {SERIAL_CAPTURE_FILE}")
+        except (OSError, ValueError) as e:
+            log_debug("sensors", f"Nu pot inregistra fluxul serial: {e}")
+    try:
+        while True:
+            try:
+                if ser is None or not ser.is_open:
                     try:
-                        data_dict = json.loads(json_str)
-                        sensor_data["distances"] = [float(d) if d != 'eroare' else -1.0 for d in data_dict.get("d", [-1.0] * 4)]
-                        sensor_data["positions"] = [float(x) for pair in zip(data_dict.get("p", [])[::2], data_dict.get("p", [])[1::2]) for x in pair] if data_dict.get("p") else []
-                        sensor_data["velocities"] = [float(v) for pair in zip(data_dict.get("v", [])[::2], data_dict.get("v", [])[1::2]) for v in pair] if data_dict.get("v") else []
-                        sensor_data["confidence"] = data_dict.get("f", [0.0])
-                        sensor_data["timestamp"] = data_dict.get("t", 0)
-                        log_debug("sensors", f"Date senzor primite: {sensor_data}")
-                        detect_people()
-                        adjust_time_alignment()
-                    except json.JSONDecodeError as e:
-                        log_debug("sensors", f"Eroare JSON: {e}, linie: {json_str}")
-                    except Exception as e:
-                        log_debug("sensors", f"Eroare neasteptata la parsare JSON: {e}, linie: {json_str}")
-                    buffer = buffer[end:].strip()
-            else:
-                if ser.in_waiting == 0 and buffer and '{' not in buffer:
-                    buffer = ""
+                        ser = open_serial(SERIAL_PORT)
+                        log_debug("sensors", f"Conectat la portul serial: {SERIAL_PORT}")
+                        ser.reset_input_buffer()
+                        ser.reset_output_buffer()
+                        SERIAL_FRAMER.reset()
+                    except serial.SerialException as e:
+                        log_debug("sensors", f"Eroare la conectare: {e}")
+                        time.sleep(5)
+                        continue
+                data = ser.read(ser.in_waiting or 1)
+                if data:
+                    if recorder is not None:
+                        recorder.write(data)
+                    for frame in SERIAL_FRAMER.feed(data):
+                        try:
+                            apply_sensor_frame(decode_serial_frame(frame))
+                        except ValueError as e:
+                            SERIAL_FRAMER.stats['invalid_frames'] += 1
+                            log_debug("sensors", f"Cadru invalid: {e}, cadru: {describe_frame(frame)}")
+                        except Exception as e:
+                            log_debug("sensors", f"Eroare neasteptata la parsarea cadrului: {e}, cadru: {describe_frame(frame)}")
                 elif ser.in_waiting == 0:
                     log_debug("sensors", "Niciun date disponibile de la serial, verificare conexiune...")
                     time.sleep(0.1)
-        except serial.SerialException as e:
-            log_debug("sensors", f"Eroare serial: {e}")
-            if ser and ser.is_open:
-                ser.close()
-            time.sleep(5)
-            continue
-        time.sleep(0.01)
+            except (serial.SerialException, OSError) as e:
+                # OSError: portul a disparut (USB deconectat, emulatorul pty oprit)
+                log_debug("sensors", f"Eroare serial: {e}")
+                if ser and ser.is_open:
+                    ser.close()
+                time.sleep(5)
+                continue
+            time.sleep(0.01)
+    finally:
+        if recorder is not None:
+            recorder.close()
+
+# Un ESP32 din SENSOR_NODES: cadrele lui sunt in sistemul propriu (0..width, 0..height, ca ROOM_WIDTH din
+# firmware) si se trec in coordonatele camerei prin rotatie in jurul originii nodului si translatie.
+class SensorNode:
+    def __init__(self, config):
+        self.id = str(config['id'])
+        self.port = config['port']
+        self.x = float(config.get('x', 0.0))
+        self.y = float(config.get('y', 0.0))
+        self.rotation = float(config.get('rotation', 0.0))
+        self.width = float(config.get('width', ROOM_WIDTH))
+        self.height = float(config.get('height', ROOM_HEIGHT))
+        # distantele brute au sensul din detect_people doar cand sistemul nodului este chiar camera
+        self.room_aligned = (self.x, self.y, self.rotation % 360, self.width, self.height) == (0.0, 0.0, 0.0, ROOM_WIDTH, ROOM_HEIGHT)
+        angle = math.radians(self.rotation)
+        self.matrix = np.array([[math.cos(angle), -math.sin(angle)], [math.sin(angle), math.cos(angle)]])
+        self.framer = SerialFramer()
+        self.ser = None
+        self.retry_at = 0.0
+        self.updated = None
+        self.timestamp = 0
+        self.distances = [-1.0] * 4
+        self.positions = np.zeros((0, 2))
+        self.velocities = np.zeros((0, 2))
+        self.confidence = np.zeros(0)
+
+    def apply(self, data_dict):
+        # starea nodului se schimba doar dupa ce tot cadrul a fost validat si convertit
+        distances = data_dict.get("d", [-1.0] * 4)
+        if not isinstance(distances, (list, np.ndarray)) or len(distances) != 4:
+            raise ValueError(f"'d' trebuie sa contina 4 distante, nu {distances!r}")
+        distances = frame_distances(data_dict)
+        positions = np.asarray(data_dict.get("p", []), dtype=np.float64)
+        positions = positions[:len(positions) // 2 * 2].reshape(-1, 2)
+        velocities = np.zeros_like(positions)
+        measured = np.asarray(data_dict.get("v", []), dtype=np.float64)
+        measured = measured[:len(measured) // 2 * 2].reshape(-1, 2)[:len(positions)]
+        velocities[:len(measured)] = measured
+        confidence = np.full(len(positions), DISTANCE_CONFIDENCE)
+        reported = np.asarray(data_dict.get("f", []), dtype=np.float64)[:len(positions)]
+        confidence[:len(reported)] = reported
+        if not len(positions):
+            positions = np.asarray(positions_from_distances(distances, self.width, self.height), dtype=np.float64).reshape(-1, 2)
+            velocities = np.zeros_like(positions)
+            confidence = np.full(len(positions), DISTANCE_CONFIDENCE)
+        self.distances = distances
+        self.positions = positions @ self.matrix.T + (self.x, self.y)
+        self.velocities = velocities @ self.matrix.T
+        self.confidence = confidence
+        self.timestamp = data_dict.get("t", 0)
+        self.updated = time.monotonic()
+
+    def fresh(self, now):
+        return self.updated is not None and now - self.updated <= SENSOR_NODE_TIMEOUT_S
+
+    def close(self):
+        if self.ser is not None:
+            try:
+                self.ser.close()
+            except (serial.SerialException, OSError):
+                pass
+            self.ser = None
+
+    def info(self, now):
+        return {'id': self.id, 'port': self.port, 'x': self.x, 'y': self.y, 'rotation': self.rotation,
+                'connected': self.ser is not None, 'age_s': None if self.updated is None else round(now - self.updated, 3),
+                'distances': self.distances, 'positions': [round(float(c), 1) for c in self.positions.ravel()]}
+
+sensor_nodes = []
+
+def fuse_sensor_nodes(nodes):
+    # persoanele tuturor nodurilor proaspete, de la cea mai sigura: una aflata la cel mult FUSION_RADIUS de o
+    # persoana deja gasita se contopeste cu ea (medie ponderata cu increderea), altfel este o persoana noua
+    now = time.monotonic()
+    fresh = [node for node in nodes if node.fresh(now)]
+    people = []
+    if fresh:
+        positions = np.concatenate([node.positions for node in fresh])
+        velocities = np.concatenate([node.velocities for node in fresh])
+        confidence = np.concatenate([node.confidence for node in fresh])
+        for i in np.argsort(-confidence, kind='stable'):
+            weight = max(float(confidence[i]), 1e-3)
+            for person in people:
+                if np.hypot(*(person['position'] - positions[i])) <= FUSION_RADIUS:
+                    total = person['weight'] + weight
+                    person['position'] = (person['position'] * person['weight'] + positions[i] * weight) / total
+                    person['velocity'] = (person['velocity'] * person['weight'] + velocities[i] * weight) / total
+                    person['confidence'] = max(person['confidence'], float(confidence[i]))
+                    person['weight'] = total
+                    break
+            else:
+                people.append({'position': positions[i], 'velocity': velocities[i], 'confidence': float(confidence[i]), 'weight': weight})
+    # distanta cea mai mica pe fiecare perete, pentru afisare si istoricul din detect_people, doar din nodurile
+    # asezate chiar in sistemul camerei: la celelalte indexul i este alt perete, iar pozitiile lor sunt deja transformate
+    aligned = [node for node in fresh if node.room_aligned]
+    distances = [min((node.distances[i] for node in aligned if node.distances[i] > 0), default=-1.0) for i in range(4)]
+    apply_sensor_frame({
+        'c': len(people),
+        'p': [round(float(c), 1) for person in people for c in person['position']],
+        'd': distances,
+        'v': [round(float(c), 2) for person in people for c in person['velocity']],
+        'f': [round(person['confidence'], 2) for person in people],
+        't': max((node.timestamp for node in fresh), default=0)
+    })
+    sensor_data['nodes'] = [node.info(now) for node in nodes]
+
+def read_sensor_nodes():
+    # o singura bucla pentru toate porturile: selectorul asteapta pe descriptorii seriali, iar fiecare nod
+    # are propriul SerialFramer, deci cadrele de pe porturi diferite nu se amesteca
+    nodes = [SensorNode(config) for config in SENSOR_NODES]
+    sensor_nodes[:] = nodes
+    selector = selectors.DefaultSelector()
+    fused = set()
+    try:
+        while True:
+            now = time.monotonic()
+            for node in nodes:
+                if node.ser is None and now >= node.retry_at:
+                    try:
+                        node.ser = serial.Serial(port=node.port, baudrate=BAUD_RATE, timeout=0)
+                        node.ser.reset_input_buffer()
+                        node.framer.reset()
+                        selector.register(node.ser.fileno(), selectors.EVENT_READ, node)
+                        log_debug("sensors", f"Nod {node.id} conectat la {node.port}")
+                    except (serial.SerialException, OSError) as e:
+                        log_debug("sensors", f"Nod {node.id}: eroare la conectare pe {node.port}: {e}")
+                        node.close()
+                        node.retry_at = now + 5
+            if not selector.get_map():
+                time.sleep(0.5)
+                continue
+            changed = False
+            for key, _ in selector.select(timeout=0.5):
+                node = key.data
+                try:
+                    data = node.ser.read(node.ser.in_waiting or 1)
+                except (serial.SerialException, OSError) as e:
+                    log_debug("sensors", f"Nod {node.id}: eroare serial: {e}")
+                    selector.unregister(key.fileobj)
+                    node.close()
+                    node.retry_at = time.monotonic() + 5
+                    continue
+                for frame in node.framer.feed(data):
+                    try:
+                        node.apply(decode_serial_frame(frame))
+                        changed = True
+                    except ValueError as e:
+                        node.framer.stats['invalid_frames'] += 1
+                        log_debug("sensors", f"Nod {node.id}: cadru invalid: {e}, cadru: {describe_frame(frame)}")
+                    except Exception as e:
+                        log_debug("sensors", f"Nod {node.id}: eroare neasteptata la parsarea cadrului: {e}, cadru: {describe_frame(frame)}")
+            # se refac si cand un nod iese din fuziune pentru ca nu a mai trimis nimic
+            now = time.monotonic()
+            current = {node.id for node in nodes if node.fresh(now)}
+            if changed or current != fused:
+                fused = current
+                try:
+                    fuse_sensor_nodes(nodes)
+                except Exception as e:
+                    log_debug("sensors", f"Eroare neasteptata la fuziunea nodurilor: {e}")
+    finally:
+        for node in nodes:
+            node.close()
+        selector.close()
+
+def sensor_reader():
+    return read_sensor_nodes if SENSOR_NODES else read_serial
 
 # Funcții audio (neschimbate)
+# Cache-ul enumerarii PortAudio, legat de instanta care a produs-o (indexii sunt valabili doar pentru ea).
+# Dispozitivele se gasesc dupa nume sau dupa ID-ul placii ALSA din /proc/asound/cards, nu dupa index,
+# iar schimbarea acestui fisier semnaleaza conectarea sau deconectarea unei placi.
+class DeviceRegistry:
+    def __init__(self, cards_path=ASOUND_CARDS_PATH):
+        self.cards_path = cards_path
+        self.backend = None
+        self.devices = []
+        # instantaneul initial vine din fisier, altfel primul poll ar arata ca un hot-plug
+        self.cards = self.read_cards()
+        self.refreshed = 0
+        self.lock = threading.Lock()
+
+    def read_cards(self):
+        cards = {}
+        try:
+            with open(self.cards_path, 'r') as f:
+                for line in f:
+                    match = re.match(r'^\s*(\d+)\s+\[(\S+)\s*\]:\s*(.*)$', line)
+                    if match:
+                        cards[int(match.group(1))] = {'id': match.group(2), 'name': match.group(3).strip()}
+        except OSError:
+            pass
+        return cards
+
+    def cards_changed(self):
+        return self.read_cards() != self.cards
+
+    def refresh(self, p):
+        devices = []
+        cards = self.read_cards()
+        for i in range(p.get_device_count()):
+            info = p.get_device_info_by_index(i)
+            hw = re.search(r'\(hw:(\d+),(\d+)\)', info['name'])
+            card = int(hw.group(1)) if hw else None
+            devices.append({'index': i, 'name': info['name'], 'card': card,
+                            'card_id': cards.get(card, {}).get('id'),
+                            'inputs': info['maxInputChannels'], 'outputs': info['maxOutputChannels']})
+            log_debug("audio", f"Device {i}: Name={info['name']}, Input={info['maxInputChannels']}, Output={info['maxOutputChannels']}")
+        with self.lock:
+            self.backend = p
+            self.devices = devices
+            self.cards = cards
+            self.refreshed = time.time()
+
+    def find(self, match, direction):
+        key = 'inputs' if direction == 'input' else 'outputs'
+        candidates = [device for device in self.devices if device[key] > 0]
+        if match:
+            wanted = match.casefold()
+            for device in candidates:
+                if device['card_id'] and device['card_id'].casefold() == wanted:
+                    return device['index']
+            for device in candidates:
+                if wanted in device['name'].casefold():
+                    return device['index']
+        return candidates[0]['index'] if candidates else None
+
+    def resolve(self):
+        with self.lock:
+            input_index = self.find(INPUT_DEVICE_MATCH, 'input')
+            output_index = self.find(OUTPUT_DEVICE_MATCH, 'output')
+        # acelasi dispozitiv nu poate fi si intrare, si iesire cand exista alternative
+        if input_index == output_index:
+            outputs = [device['index'] for device in self.devices if device['outputs'] > 0 and device['index'] != input_index]
+            if outputs:
+                output_index = outputs[0]
+        return input_index, output_index
+
+    def snapshot(self):
+        with self.lock:
+            return {'devices': list(self.devices), 'cards': dict(self.cards), 'refreshed': self.refreshed}
+
+DEVICE_REGISTRY = DeviceRegistry()
+
 def find_audio_devices(p):
-    loopback_idx = None
-    output_idx = None
-    for i in range(p.get_device_count()):
-        info = p.get_device_info_by_index(i)
-        log_debug("audio", f"Device {i}: Name={info['name']}, Input={info['maxInputChannels']}, Output={info['maxOutputChannels']}")
-        if 'Loopback' in info['name'] and info['maxInputChannels'] > 0:
-            loopback_idx = i
-        elif 'IQAUDIO' in info['name'] and info['maxOutputChannels'] > 0:
-            output_idx = i
-        elif info['maxInputChannels'] > 0 and loopback_idx is None:
-            loopback_idx = i
-        elif info['maxOutputChannels'] > 0 and output_idx is None:
-            output_idx = i
+    # enumerarea se face o singura data per instanta PyAudio, apoi se foloseste cache-ul
+    if DEVICE_REGISTRY.backend is not p:
+        DEVICE_REGISTRY.refresh(p)
+    loopback_idx, output_idx = DEVICE_REGISTRY.resolve()
     if loopback_idx is None or output_idx is None:
         log_debug("audio", "Dispozitive loopback sau output lipsa!")
     return loopback_idx, output_idx
 
+def load_audio(path):
+    # cadre int16 (frames, channels) si rata; .npy poate fi int16 sau float in [-1, 1]
+    if str(path).endswith('.npy'):
+        data = np.load(path)
+        if data.dtype.kind == 'f':
+            data = np.clip(np.rint(data * 32767), -32768, 32767)
+        data = data.astype(np.int16)
+        return (data[:, None] if data.ndim == 1 else data), RATE
+    with wave.open(str(path), 'rb') as wav:
+        if wav.getsampwidth() != 2:
+            raise ValueError(f"{path}: sunt suportate doar fisiere WAV pe 16 biti")
+        frames = wav.readframes(wav.getnframes())
+        return np.frombuffer(frames, dtype=np.int16).reshape(-1, wav.getnchannels()), wav.getframerate()
+
+# Afinitatea si politica de planificare se aplica thread-ului apelant (pid 0 = thread-ul curent pe Linux).
+# Fara drepturi sau pe alte platforme se pastreaza planificarea existenta; raportul spune ce s-a aplicat efectiv.
+def apply_realtime_policy(role):
+    report = {'role': role, 'thread': threading.current_thread().name, 'tid': threading.get_native_id(), 'errors': []}
+    if AUDIO_CPU_AFFINITY:
+        try:
+            os.sched_setaffinity(0, AUDIO_CPU_AFFINITY)
+        except (AttributeError, OSError, ValueError) as e:
+            report['errors'].append(f"afinitate {AUDIO_CPU_AFFINITY}: {e}")
+    if AUDIO_SCHED_POLICY:
+        try:
+            policy = {'fifo': os.SCHED_FIFO, 'rr': os.SCHED_RR}[AUDIO_SCHED_POLICY]
+            priority = min(max(AUDIO_SCHED_PRIORITY, os.sched_get_priority_min(policy)), os.sched_get_priority_max(policy))
+            os.sched_setscheduler(0, policy, os.sched_param(priority))
+        except KeyError:
+            report['errors'].append(f"politica necunoscuta {AUDIO_SCHED_POLICY}")
+        except (AttributeError, OSError, ValueError) as e:
+            report['errors'].append(f"politica {AUDIO_SCHED_POLICY}: {e}")
+    try:
+        report['affinity'] = sorted(os.sched_getaffinity(0))
+        policy = os.sched_getscheduler(0)
+        report['policy'] = {os.SCHED_FIFO: 'fifo', os.SCHED_RR: 'rr'}.get(policy, 'other')
+        report['priority'] = os.sched_getparam(0).sched_priority
+    except (AttributeError, OSError):
+        report.update(affinity=None, policy=None, priority=None)
+    for error in report['errors']:
+        log_debug("audio", f"Thread {role}: {error}, continui cu planificarea curenta")
+    return report
+
+# Stream cu interfata pyaudio.Stream peste un backend virtual. Citirile sunt ritmate dupa ceasul de perete
+# (speed), iar cu stream_callback un thread propriu joaca rolul thread-ului PortAudio.
+class VirtualStream:
+    def __init__(self, backend, channels, rate, frames_per_buffer, input=False, stream_callback=None, start=True):
+        self.backend = backend
+        self.channels = channels
+        self.rate = rate
+        self.frames_per_buffer = frames_per_buffer
+        self.is_input = input
+        self.callback = stream_callback
+        self.active = False
+        self.thread = None
+        self.clock_start = 0.0
+        self.frames = 0
+        if start:
+            self.start_stream()
+
+    def start_stream(self):
+        if self.active:
+            return
+        self.active = True
+        self.clock_start = time.perf_counter()
+        self.frames = 0
+        if self.callback is not None:
+            self.thread = threading.Thread(target=self.run_callback, daemon=True)
+            self.thread.start()
+
+    def stop_stream(self):
+        self.active = False
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=1.0)
+        self.thread = None
+
+    def is_active(self):
+        return self.active
+
+    def close(self):
+        self.stop_stream()
+
+    def pace(self, frames, speed):
+        # asteapta momentul in care un dispozitiv real ar fi livrat sau consumat aceste cadre
+        if speed > 0:
+            delay = self.clock_start + (self.frames + frames) / (self.rate * speed) - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        self.frames += frames
+
+    def read(self, num_frames, exception_on_overflow=True):
+        self.pace(num_frames, self.backend.speed)
+        return self.backend.source(num_frames, self.channels).tobytes()
+
+    def write(self, frames, num_frames=None, exception_on_underflow=False):
+        self.backend.sink(np.frombuffer(frames, dtype=np.int16).reshape(-1, self.channels))
+
+    def get_read_available(self):
+        return 0
+
+    def get_write_available(self):
+        return self.frames_per_buffer
+
+    def get_input_latency(self):
+        return self.frames_per_buffer / self.rate
+
+    def get_output_latency(self):
+        return self.frames_per_buffer / self.rate
+
+    def run_callback(self):
+        # cele doua thread-uri de callback raman sincronizate doar daca sunt ritmate, deci speed 0 devine 1
+        frames = self.frames_per_buffer
+        speed = self.backend.speed or 1.0
+        while self.active:
+            self.pace(frames, speed)
+            if self.is_input:
+                _, flag = self.callback(self.backend.source(frames, self.channels).tobytes(), frames, {}, 0)
+            else:
+                data, flag = self.callback(None, frames, {}, 0)
+                self.backend.sink(np.frombuffer(data, dtype=np.int16).reshape(-1, self.channels))
+            if flag != pyaudio.paContinue:
+                self.active = False
+
+# Backend audio fara placa de sunet, cu aceeasi interfata ca pyaudio.PyAudio: un dispozitiv de intrare si unul
+# de iesire, stream-uri virtuale, iar iesirea se numara si optional se salveaza in AUDIO_OUTPUT_FILE.
+class VirtualAudioBackend:
+    name = 'virtual'
+
+    def __init__(self, speed=None, output_path=None):
+        self.speed = AUDIO_BACKEND_SPEED if speed is None else speed
+        self.output_path = AUDIO_OUTPUT_FILE if output_path is None else output_path
+        self.output_wav = None
+        self.output_blocks = []
+        self.frames_read = 0
+        self.frames_written = 0
+        self.finished = False
+
+    def get_device_count(self):
+        return 2
+
+    def get_device_info_by_index(self, index):
+        return [{'name': f"{self.name} input", 'maxInputChannels': CHANNELS, 'maxOutputChannels': 0, 'defaultSampleRate': RATE},
+                {'name': f"{self.name} output", 'maxInputChannels': 0, 'maxOutputChannels': 32, 'defaultSampleRate': RATE}][index]
+
+    def open(self, format=FORMAT, channels=CHANNELS, rate=RATE, input=False, output=False, input_device_index=None,
+             output_device_index=None, frames_per_buffer=CHUNK, start=True, stream_callback=None):
+        return VirtualStream(self, channels, rate, frames_per_buffer, input, stream_callback, start)
+
+    def source(self, frames, channels):
+        self.frames_read += frames
+        return self.generate(frames, channels)
+
+    def generate(self, frames, channels):
+        return np.zeros((frames, channels), dtype=np.int16)
+
+    def sink(self, samples):
+        self.frames_written += len(samples)
+        if not self.output_path:
+            return
+        if str(self.output_path).endswith('.npy'):
+            self.output_blocks.append(samples.copy())
+            return
+        if self.output_wav is None:
+            self.output_wav = wave.open(str(self.output_path), 'wb')
+            self.output_wav.setnchannels(samples.shape[1])
+            self.output_wav.setsampwidth(2)
+            self.output_wav.setframerate(RATE)
+        self.output_wav.writeframes(samples.tobytes())
+
+    def terminate(self):
+        if self.output_wav is not None:
+            self.output_wav.close()
+            self.output_wav = None
+        if self.output_blocks:
+            np.save(self.output_path, np.concatenate(self.output_blocks))
+            self.output_blocks = []
+
+class FileAudioBackend(VirtualAudioBackend):
+    name = 'file'
+
+    def __init__(self, path, loop=None, **kwargs):
+        super().__init__(**kwargs)
+        self.data, rate = load_audio(path)
+        if rate != RATE:
+            log_debug("audio", f"{path}: rata {rate} Hz difera de {RATE} Hz, redau fara conversie")
+        self.loop = AUDIO_INPUT_LOOP if loop is None else loop
+        self.position = 0
+
+    def generate(self, frames, channels):
+        block = np.zeros((frames, channels), dtype=np.int16)
+        filled = 0
+        while filled < frames and not self.finished:
+            take = min(frames - filled, len(self.data) - self.position)
+            chunk = self.data[self.position:self.position + take]
+            # fisierele mono se duplica pe toate canalele, canalele in plus se ignora
+            if chunk.shape[1] == 1:
+                block[filled:filled + take] = chunk
+            else:
+                used = min(channels, chunk.shape[1])
+                block[filled:filled + take, :used] = chunk[:, :used]
+            filled += take
+            self.position += take
+            if self.position >= len(self.data):
+                self.position = 0
+                self.finished = not self.loop
+        return block
+
+class SyntheticAudioBackend(VirtualAudioBackend):
+    name = 'synthetic'
+
+    def __init__(self, signal=None, **kwargs):
+        super().__init__(**kwargs)
+        self.signal = dict(SYNTHETIC_SIGNAL if signal is None else signal)
+        if self.signal.get('type', 'sine') not in ('sine', 'sweep', 'noise', 'impulse', 'silence'):
+            raise ValueError(f"Semnal sintetic necunoscut: {self.signal.get('type')}")
+        self.rng = np.random.default_rng(self.signal.get('seed'))
+        self.sample = 0
+
+    def generate(self, frames, channels):
+        kind = self.signal.get('type', 'sine')
+        amplitude = float(self.signal.get('amplitude', 0.3)) * 32767
+        t = (self.sample + np.arange(frames)) / RATE
+        self.sample += frames
+        if kind == 'sine':
+            curve = np.sin(2 * np.pi * float(self.signal.get('freq', 440.0)) * t)
+        elif kind == 'sweep':
+            # sweep logaritmic repetat, cu faza continua in interiorul fiecarei perioade
+            f0, f1 = float(self.signal.get('start', 20.0)), float(self.signal.get('end', 20000.0))
+            duration = float(self.signal.get('duration', 5.0))
+            k = np.log(f1 / f0)
+            local = t % duration
+            curve = np.sin(2 * np.pi * f0 * duration / k * (np.exp(local / duration * k) - 1))
+        elif kind == 'noise':
+            return np.clip(self.rng.normal(0, amplitude / 3, (frames, channels)), -32767, 32767).astype(np.int16)
+        elif kind == 'impulse':
+            period = max(1, int(float(self.signal.get('period', 1.0)) * RATE))
+            curve = ((self.sample - frames + np.arange(frames)) % period == 0).astype(np.float64)
+        else:
+            curve = np.zeros(frames)
+        return np.repeat((curve * amplitude).astype(np.int16)[:, None], channels, axis=1)
+
+def create_audio_backend():
+    if AUDIO_BACKEND == 'pyaudio':
+        return pyaudio.PyAudio()
+    if AUDIO_BACKEND == 'file':
+        return FileAudioBackend(AUDIO_INPUT_FILE)
+    if AUDIO_BACKEND == 'synthetic':
+        return SyntheticAudioBackend()
+    raise ValueError(f"Backend audio necunoscut: {AUDIO_BACKEND}")
+
+@functools.lru_cache(maxsize=4096)
+def lagrange_coefficients(order, step):
+    d = step / FRACTIONAL_DELAY_STEPS
+    taps = np.arange(order + 1)
+    h = np.ones(order + 1)
+    for m in range(order + 1):
+        others = taps != m
+        h[others] *= (d - m) / (taps[others] - m)
+    return h.astype(np.float32)
+
+# Linie de intarziere circulara: scriere si citire cu cel mult doua felii contigue pe bloc,
+# cu delay fractionar redat prin interpolare Lagrange si tranzitii fara click-uri
+class DelayLine:
+    def __init__(self, channels, max_delay, max_block, order=FRACTIONAL_DELAY_ORDER,
+                 transition=DELAY_TRANSITION, transition_samples=DELAY_TRANSITION_SAMPLES):
+        self.channels = channels
+        self.max_delay = max_delay
+        self.order = order
+        self.size = max_delay + max_block + order
+        self.buffer = np.zeros((channels, self.size), dtype=np.float32)
+        self.segment = np.zeros(max_block + order, dtype=np.float32)
+        self.scratch = np.zeros(max_block, dtype=np.float32)
+        self.write_index = 0
+        self.transition = transition
+        self.transition_samples = max(1, transition_samples)
+        self.current = [0.0] * channels
+        self.target = [0.0] * channels
+        self.slope = [0.0] * channels
+        self.fade_to = [None] * channels
+        self.fade_pos = [0] * channels
+        self.steps = np.arange(1, max_block + 1, dtype=np.float64)
+        self.offsets = np.arange(max_block, dtype=np.int64)
+        self.ramp = np.zeros(max_block, dtype=np.float64)
+        self.var_base = np.zeros(max_block, dtype=np.float64)
+        self.var_frac = np.zeros(max_block, dtype=np.float64)
+        self.var_coef = np.zeros(max_block, dtype=np.float64)
+        self.var_term = np.zeros(max_block, dtype=np.float64)
+        self.var_index = np.zeros(max_block, dtype=np.int64)
+        self.var_taps = np.zeros(max_block, dtype=np.int64)
+        self.var_samples = np.zeros(max_block, dtype=np.float32)
+        self.fade_buffer = np.zeros(max_block, dtype=np.float32)
+        # curba de crossfade liniara, completata cu 1 ca un bloc sa poata depasi sfarsitul tranzitiei
+        self.fade_curve = np.ones(self.transition_samples + max_block, dtype=np.float32)
+        self.fade_curve[:self.transition_samples] = np.arange(1, self.transition_samples + 1) / self.transition_samples
+
+    def write(self, block):
+        n = block.shape[1]
+        start = self.write_index
+        first = min(n, self.size - start)
+        self.buffer[:, start:start + first] = block[:, :first]
+        if first < n:
+            self.buffer[:, :n - first] = block[:, first:]
+
+    def copy_segment(self, channel, delay, out):
+        n = len(out)
+        start = (self.write_index - delay) % self.size
+        first = min(n, self.size - start)
+        out[:first] = self.buffer[channel, start:start + first]
+        if first < n:
+            out[first:] = self.buffer[channel, :n - first]
+
+    def read(self, channel, delay, out):
+        n = len(out)
+        delay = min(max(float(delay), 0.0), self.max_delay)
+        if self.order == 0:
+            self.copy_segment(channel, int(round(delay)), out)
+            return
+        whole, step = divmod(int(round(delay * FRACTIONAL_DELAY_STEPS)), FRACTIONAL_DELAY_STEPS)
+        if step == 0:
+            self.copy_segment(channel, whole, out)
+            return
+        # baza centreaza delay-ul in fereastra filtrului; out[i] = sum h[k] * x[i - base - k]
+        base = max(0, whole - (self.order - 1) // 2)
+        h = lagrange_coefficients(self.order, (whole - base) * FRACTIONAL_DELAY_STEPS + step)
+        segment = self.segment[:n + self.order]
+        self.copy_segment(channel, base + self.order, segment)
+        scratch = self.scratch[:n]
+        np.multiply(segment[self.order:], h[0], out=out)
+        for k in range(1, self.order + 1):
+            np.multiply(segment[self.order - k:self.order - k + n], h[k], out=scratch)
+            np.add(out, scratch, out=out)
+
+    def read_varying(self, channel, delays, out):
+        # delay diferit pe fiecare esantion: coeficientii Lagrange se calculeaza vectorial pe tot blocul
+        n = len(out)
+        order = max(self.order, 1)
+        base, frac, coef, term = self.var_base[:n], self.var_frac[:n], self.var_coef[:n], self.var_term[:n]
+        newest, taps, samples = self.var_index[:n], self.var_taps[:n], self.var_samples[:n]
+        np.floor(delays, out=base)
+        base -= (order - 1) // 2
+        np.maximum(base, 0, out=base)
+        np.subtract(delays, base, out=frac)
+        np.subtract(self.offsets[:n], base, out=newest, casting='unsafe')
+        newest += self.write_index
+        out[:] = 0
+        for k in range(order + 1):
+            coef[:] = 1.0
+            for m in range(order + 1):
+                if m != k:
+                    np.subtract(frac, m, out=term)
+                    term *= 1.0 / (k - m)
+                    coef *= term
+            np.subtract(newest, k, out=taps)
+            np.take(self.buffer[channel], taps, out=samples, mode='wrap')
+            coef *= samples
+            np.add(out, coef, out=out, casting='same_kind')
+
+    def read_ramp(self, channel, target, out):
+        current = self.current[channel]
+        if target != self.target[channel]:
+            self.target[channel] = target
+            self.slope[channel] = abs(target - current) / self.transition_samples
+        if current == target:
+            self.read(channel, current, out)
+            return
+        n = len(out)
+        ramp = self.ramp[:n]
+        np.multiply(self.steps[:n], self.slope[channel], out=ramp)
+        np.minimum(ramp, abs(target - current), out=ramp)
+        if target < current:
+            np.negative(ramp, out=ramp)
+        ramp += current
+        self.current[channel] = target if ramp[-1] == target else float(ramp[-1])
+        self.read_varying(channel, ramp, out)
+
+    def read_crossfade(self, channel, target, out):
+        if self.fade_to[channel] is None:
+            if target == self.current[channel]:
+                self.read(channel, target, out)
+                return
+            self.fade_to[channel] = target
+            self.fade_pos[channel] = 0
+        # o tinta noua sosita in timpul unei tranzitii porneste dupa terminarea celei curente
+        n = len(out)
+        pos = self.fade_pos[channel]
+        faded = self.fade_buffer[:n]
+        self.read(channel, self.current[channel], out)
+        self.read(channel, self.fade_to[channel], faded)
+        np.subtract(faded, out, out=faded)
+        np.multiply(faded, self.fade_curve[pos:pos + n], out=faded)
+        np.add(out, faded, out=out)
+        self.fade_pos[channel] = pos + n
+        if self.fade_pos[channel] >= self.transition_samples:
+            self.current[channel] = self.fade_to[channel]
+            self.fade_to[channel] = None
+
+    def advance(self, n):
+        self.write_index = (self.write_index + n) % self.size
+
+    def process(self, block, delays, out):
+        self.write(block)
+        for ch in range(self.channels):
+            target = min(max(float(delays[ch]), 0.0), self.max_delay)
+            if self.transition == 'ramp':
+                self.read_ramp(ch, target, out[ch])
+            elif self.transition == 'crossfade':
+                self.read_crossfade(ch, target, out[ch])
+            else:
+                self.read(ch, target, out[ch])
+                self.current[ch] = target
+        self.advance(block.shape[1])
+
+class HRIRSet:
+    def __init__(self, azimuths, hrirs):
+        self.azimuths = np.asarray(azimuths, dtype=np.float64) % 360
+        self.hrirs = np.asarray(hrirs, dtype=np.float32)
+        self.taps = self.hrirs.shape[-1]
+        self.spectra_cache = {}
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        if 'Data.IR' in data:
+            hrirs = data['Data.IR']
+            source = np.atleast_2d(data['SourcePosition'])
+            azimuths = source[:, 0]
+            # doar masuratorile din planul orizontal, daca fisierul contine si elevatii
+            if source.shape[1] > 1 and np.any(np.abs(source[:, 1]) < 1e-3):
+                horizontal = np.abs(source[:, 1]) < 1e-3
+                hrirs, azimuths = hrirs[horizontal], azimuths[horizontal]
+            rate = float(np.ravel(data['Data.SamplingRate'])[0]) if 'Data.SamplingRate' in data else RATE
+        else:
+            hrirs = data['hrir']
+            azimuths = data['azimuths']
+            rate = float(data['rate']) if 'rate' in data else RATE
+        if rate != RATE:
+            log_debug("audio", f"HRIR-urile din {path} au rata {rate:.0f} Hz, diferita de {RATE} Hz")
+        log_debug("audio", f"HRIR incarcate din {path}: {len(azimuths)} azimuturi, {hrirs.shape[-1]} coeficienti")
+        return cls(azimuths, hrirs)
+
+    def nearest(self, azimuth):
+        diff = np.abs((self.azimuths - azimuth + 180) % 360 - 180)
+        return int(np.argmin(diff))
+
+    def spectra(self, index, partition):
+        key = (index, partition)
+        if key not in self.spectra_cache:
+            parts = -(-self.taps // partition)
+            padded = np.zeros((2, parts * partition), dtype=np.float32)
+            padded[:, :self.taps] = self.hrirs[index, :2]
+            self.spectra_cache[key] = np.fft.rfft(padded.reshape(2, parts, partition), n=2 * partition, axis=-1).astype(np.complex64)
+        return self.spectra_cache[key]
+
+# Convolutie overlap-save cu partitii uniforme: fiecare canal de intrare este filtrat cu HRIR-ul urechii corespunzatoare
+class PartitionedConvolver:
+    def __init__(self, hrirs, channels=CHANNELS, partition=CHUNK):
+        self.hrirs = hrirs
+        self.channels = channels
+        self.partition = partition
+        self.parts = -(-hrirs.taps // partition)
+        for index in range(len(hrirs.azimuths)):
+            hrirs.spectra(index, partition)
+        self.history = np.zeros((channels, 2 * partition), dtype=np.float32)
+        self.fdl = np.zeros((channels, self.parts, partition + 1), dtype=np.complex64)
+        self.fdl_index = 0
+        self.orders = [(i - np.arange(self.parts)) % self.parts for i in range(self.parts)]
+        self.fade = (np.arange(1, partition + 1) / partition).astype(np.float32)
+        self.accumulator = np.zeros((channels, partition + 1), dtype=np.complex64)
+        self.product = np.zeros((channels, partition + 1), dtype=np.complex64)
+        self.index = 0
+        self.spectra = hrirs.spectra(0, partition)
+        self.next_spectra = None
+
+    def set_azimuth(self, azimuth):
+        index = self.hrirs.nearest(azimuth)
+        if index != self.index:
+            self.index = index
+            self.next_spectra = self.hrirs.spectra(index, self.partition)
+
+    def render(self, spectra):
+        # rfft/irfft din numpy 1.26 nu accepta out=, restul produsului spectral foloseste buffere prealocate
+        self.accumulator[:] = 0
+        for p, slot in enumerate(self.orders[self.fdl_index]):
+            np.multiply(self.fdl[:, slot], spectra[:self.channels, p], out=self.product)
+            np.add(self.accumulator, self.product, out=self.accumulator)
+        return np.fft.irfft(self.accumulator, n=2 * self.partition, axis=-1)[:, self.partition:]
+
+    def process(self, block, out):
+        b = self.partition
+        for start in range(0, block.shape[1], b):
+            self.history[:, :b] = self.history[:, b:]
+            self.history[:, b:] = block[:, start:start + b]
+            self.fdl[:, self.fdl_index] = np.fft.rfft(self.history, axis=-1)
+            y = self.render(self.spectra)
+            if self.next_spectra is not None:
+                # schimbarea filtrului refoloseste spectrele de intrare deja calculate si face crossfade pe o partitie
+                spectra = self.next_spectra
+                self.next_spectra = None
+                y += (self.render(spectra) - y) * self.fade
+                self.spectra = spectra
+            out[:, start:start + b] = y
+            self.fdl_index = (self.fdl_index + 1) % self.parts
+
+# Coeficienti biquad dupa RBJ Audio EQ Cookbook, normalizati la a0 = 1: [b0, b1, b2, 1, a1, a2]
+def design_biquad(band, rate=RATE):
+    kind = band.get('type', 'peaking')
+    freq = float(band['freq'])
+    gain_db = float(band.get('gain_db', 0.0))
+    q = float(band.get('q', 0.7071))
+    if kind not in EQ_TYPES:
+        raise ValueError(f"Tip de filtru necunoscut: {kind}")
+    if not 0 < freq < rate / 2 or q <= 0:
+        raise ValueError(f"Frecventa sau Q invalide: freq={freq}, q={q}")
+    a = 10 ** (gain_db / 40)
+    w0 = 2 * np.pi * freq / rate
+    cw = np.cos(w0)
+    alpha = np.sin(w0) / (2 * q)
+    if kind == 'peaking':
+        b0, b1, b2 = 1 + alpha * a, -2 * cw, 1 - alpha * a
+        a0, a1, a2 = 1 + alpha / a, -2 * cw, 1 - alpha / a
+    elif kind == 'lowshelf':
+        sa = 2 * np.sqrt(a) * alpha
+        b0, b1, b2 = a * ((a + 1) - (a - 1) * cw + sa), 2 * a * ((a - 1) - (a + 1) * cw), a * ((a + 1) - (a - 1) * cw - sa)
+        a0, a1, a2 = (a + 1) + (a - 1) * cw + sa, -2 * ((a - 1) + (a + 1) * cw), (a + 1) + (a - 1) * cw - sa
+    elif kind == 'highshelf':
+        sa = 2 * np.sqrt(a) * alpha
+        b0, b1, b2 = a * ((a + 1) + (a - 1) * cw + sa), -2 * a * ((a - 1) + (a + 1) * cw), a * ((a + 1) + (a - 1) * cw - sa)
+        a0, a1, a2 = (a + 1) - (a - 1) * cw + sa, 2 * ((a - 1) - (a + 1) * cw), (a + 1) - (a - 1) * cw - sa
+    elif kind == 'lowpass':
+        b0, b1, b2 = (1 - cw) / 2, 1 - cw, (1 - cw) / 2
+        a0, a1, a2 = 1 + alpha, -2 * cw, 1 - alpha
+    elif kind == 'highpass':
+        b0, b1, b2 = (1 + cw) / 2, -(1 + cw), (1 + cw) / 2
+        a0, a1, a2 = 1 + alpha, -2 * cw, 1 - alpha
+    else:
+        b0, b1, b2 = 1.0, -2 * cw, 1.0
+        a0, a1, a2 = 1 + alpha, -2 * cw, 1 - alpha
+    return np.array([b0, b1, b2, a0, a1, a2]) / a0
+
+# Cascada de biquad-uri aplicata pe toate canalele deodata. La schimbarea coeficientilor starea trece prin
+# istoricul DF1 al fiecarei sectiuni (ultimele doua intrari si iesiri), care nu depinde de coeficienti, deci
+# noile filtre continua semnalul fara discontinuitati. Cu scipy se foloseste sosfilt cu zi; fara scipy, toata
+# cascada este o singura inmultire matriciala pe bloc (raspunsul exact al filtrului pe lungimea blocului).
+class BiquadBank:
+    def __init__(self, channels, block_sizes):
+        self.channels = channels
+        self.block_sizes = list(block_sizes)
+        self.history = np.zeros((0, 4, channels))
+        self.design = (np.zeros((0, 6)), {})
+        self.active = self.design[0]
+        self.zi = np.zeros((0, channels, 2))
+        self.last_zi = self.zi.copy()
+        self.last_input = np.zeros((channels, max(self.block_sizes)))
+        self.last_n = 0
+        self.input = np.zeros((max(self.block_sizes), channels))
+
+    def set_bands(self, bands):
+        sos = np.array([design_biquad(band) for band in bands]).reshape(-1, 6)
+        matrices = {}
+        if scipy_signal is None and len(sos):
+            matrices = {n: self.block_matrices(sos, n) for n in self.block_sizes}
+        # inlocuire atomica, thread-ul audio preia noii coeficienti la urmatorul bloc
+        self.design = (sos, matrices)
+
+    def block_matrices(self, sos, n):
+        sections = len(sos)
+        size = 4 * sections
+        # coloana 0: impuls la intrare; coloanele 1..size: cate un element unitar de istoric
+        hist = np.zeros((sections, 4, size + 1))
+        hist.reshape(size, size + 1)[:, 1:] = np.eye(size)
+        outputs = np.zeros((n, size + 1))
+        trajectory = np.zeros((n, size))
+        x = np.zeros(size + 1)
+        for t in range(n):
+            x[:] = 0
+            x[0] = 1.0 if t == 0 else 0.0
+            y = x
+            for k in range(sections):
+                b0, b1, b2, _, a1, a2 = sos[k]
+                out = b0 * y + b1 * hist[k, 0] + b2 * hist[k, 1] - a1 * hist[k, 2] - a2 * hist[k, 3]
+                hist[k, 1] = hist[k, 0]
+                hist[k, 0] = y
+                hist[k, 3] = hist[k, 2]
+                hist[k, 2] = out
+                y = out
+            outputs[t] = y
+            trajectory[t] = hist[:, :, 0].reshape(size)
+        lags = np.arange(n)[:, None] - np.arange(n)[None, :]
+        forward = np.zeros((n + size, n))
+        forward[:n] = np.where(lags >= 0, outputs[np.maximum(lags, 0), 0], 0.0)
+        forward[n:] = trajectory[::-1].T
+        feedback = np.zeros((n + size, size))
+        feedback[:n] = outputs[:, 1:]
+        feedback[n:] = hist.reshape(size, size + 1)[:, 1:]
+        return forward, feedback
+
+    def resize_history(self, sections):
+        # la schimbarea numarului de benzi, sectiunile noi pornesc din istoricul iesirii anterioare
+        history = np.zeros((sections, 4, self.channels))
+        keep = min(sections, len(self.history))
+        history[:keep] = self.history[:keep]
+        for k in range(keep, sections):
+            source = history[k - 1, 2:] if k > 0 else history[k, :2]
+            history[k, :2] = source
+            history[k, 2:] = source
+        self.history = history
+
+    def replay_history(self):
+        # istoricul DF1 al fiecarei sectiuni, reconstruit din ultimul bloc procesat cu vechii coeficienti
+        x = self.last_input[:, :self.last_n]
+        history = np.zeros((len(self.active), 4, self.channels))
+        for k, section in enumerate(self.active):
+            y, _ = scipy_signal.lfilter(section[:3], section[3:], x, axis=-1, zi=self.last_zi[k])
+            history[k] = [x[:, -1], x[:, -2], y[:, -1], y[:, -2]]
+            x = y
+        return history
+
+    def switch(self, sos):
+        if scipy_signal is not None and len(self.active) and self.last_n >= 2:
+            self.history = self.replay_history()
+        if len(self.history) != len(sos):
+            self.resize_history(len(sos))
+        self.active = sos
+        if scipy_signal is not None:
+            h = self.history
+            b1, b2, a1, a2 = (sos[:, i, None] for i in (1, 2, 4, 5))
+            self.zi = np.stack([b1 * h[:, 0] + b2 * h[:, 1] - a1 * h[:, 2] - a2 * h[:, 3],
+                                b2 * h[:, 0] - a2 * h[:, 2]], axis=-1)
+            self.last_zi = self.zi.copy()
+            self.last_n = 0
+
+    def process(self, block):
+        sos, matrices = self.design
+        if sos is not self.active:
+            self.switch(sos)
+        if not len(sos):
+            return
+        n = block.shape[1]
+        if scipy_signal is not None:
+            self.last_zi[:] = self.zi
+            self.last_input[:, :n] = block
+            self.last_n = n
+            y, self.zi = scipy_signal.sosfilt(sos, block, axis=-1, zi=self.zi)
+            block[:] = y
+            return
+        if n not in matrices:
+            log_debug("audio", f"EQ: calculez matricile pentru blocuri de {n} esantioane")
+            matrices[n] = self.block_matrices(sos, n)
+        forward, feedback = matrices[n]
+        state = self.input[:n]
+        np.copyto(state, block.T)
+        result = forward @ state + feedback @ self.history.reshape(-1, self.channels)
+        block[:] = result[:n].T
+        self.history[:] = result[n:].reshape(self.history.shape)
+
+# Limitator stereo-linkat cu look-ahead: castigul necesar se calculeaza din varful comun al canalelor, apoi
+# minim glisant pe fereastra de look-ahead, revenire liniara in dB si netezire cu medie mobila. Semnalul este
+# intarziat cu look-ahead-ul, astfel incat castigul ajunge la tinta exact cand soseste varful.
+class LookaheadLimiter:
+    def __init__(self, channels, max_block, ceiling_db=LIMITER_CEILING_DB, attack_ms=LIMITER_ATTACK_MS,
+                 release_ms=LIMITER_RELEASE_MS):
+        self.channels = channels
+        self.lookahead = max(1, int(min(attack_ms, LIMITER_MAX_ATTACK_MS) * RATE / 1000))
+        self.set_params(ceiling_db, release_ms)
+        la = self.lookahead
+        self.window = la + 1
+        self.audio = np.zeros((channels, la + max_block), dtype=np.float32)
+        self.magnitude = np.zeros((channels, max_block), dtype=np.float32)
+        padded = -(-(la + max_block) // self.window) * self.window
+        self.target = np.zeros(padded)
+        self.prefix = np.zeros(padded)
+        self.suffix = np.zeros(padded)
+        self.held = np.zeros(max_block)
+        self.released = np.zeros(la + max_block)
+        self.sums = np.zeros(la + max_block + 1)
+        self.gain = np.zeros(max_block)
+        self.ramp = np.arange(1, max_block + 1, dtype=np.float64)
+        self.last_db = 0.0
+        self.reduction_db = 0.0
+        self.max_reduction_db = 0.0
+        self.limited_blocks = 0
+
+    def set_params(self, ceiling_db, release_ms):
+        self.ceiling_db = float(min(ceiling_db, 0.0))
+        self.release_db = 10.0 / max(release_ms * RATE / 1000, 1.0)
+
+    def process(self, block):
+        n = block.shape[1]
+        la = self.lookahead
+        w = self.window
+
+        # tinta in dB pentru fiecare esantion nou, dupa intarzierea cu look-ahead
+        magnitude = self.magnitude[:, :n]
+        np.abs(block, out=magnitude)
+        target = self.target[la:la + n]
+        np.max(magnitude, axis=0, out=target)
+        np.maximum(target, 1e-9, out=target)
+        np.log10(target, out=target)
+        target *= -20.0
+        target += self.ceiling_db + 20 * np.log10(32767.0)
+        np.minimum(target, 0.0, out=target)
+
+        # minim glisant pe fereastra look-ahead (van Herk / Gil-Werman, vectorial)
+        length = -(-(la + n) // w) * w
+        self.target[la + n:length] = 0.0
+        blocks = self.target[:length].reshape(-1, w)
+        prefix = self.prefix[:length].reshape(-1, w)
+        suffix = self.suffix[:length].reshape(-1, w)
+        np.minimum.accumulate(blocks, axis=1, out=prefix)
+        np.minimum.accumulate(blocks[:, ::-1], axis=1, out=suffix[:, ::-1])
+        held = self.held[:n]
+        np.minimum(self.suffix[:n], self.prefix[w - 1:w - 1 + n], out=held)
+        self.target[:la] = self.target[n:n + la]
+
+        # revenire: r[i] = min(h[i], r[i-1] + pas), rezolvat cu minim cumulativ
+        released = self.released[la:la + n]
+        ramp = self.ramp[:n]
+        np.multiply(ramp, self.release_db, out=released)
+        np.subtract(held, released, out=released)
+        np.minimum.accumulate(released, out=released)
+        np.minimum(released, self.last_db, out=released)
+        released += ramp * self.release_db
+        self.last_db = float(released[-1])
+
+        # netezire cu medie mobila pe fereastra look-ahead + 1; media nu depaseste tinta niciunui varf din fereastra
+        sums = self.sums[:la + n + 1]
+        sums[0] = 0.0
+        np.cumsum(self.released[:la + n], out=sums[1:])
+        gain = self.gain[:n]
+        np.subtract(sums[w:w + n], sums[:n], out=gain)
+        gain *= 1.0 / w
+        self.released[:la] = self.released[n:n + la]
+        np.multiply(gain, 1 / 20.0, out=gain)
+        np.power(10.0, gain, out=gain)
+
+        audio = self.audio
+        audio[:, la:la + n] = block
+        np.multiply(audio[:, :n], gain, out=block, casting='same_kind')
+        audio[:, :la] = audio[:, n:n + la]
+
+        self.reduction_db = max(0.0, -20 * float(np.log10(gain[-1])))
+        block_reduction = max(0.0, -20 * float(np.log10(gain.min())))
+        self.max_reduction_db = max(self.max_reduction_db, block_reduction)
+        if block_reduction > 0.01:
+            self.limited_blocks += 1
+
+    def telemetry(self):
+        return {
+            'ceiling_db': self.ceiling_db,
+            'gain_reduction_db': round(float(self.reduction_db), 2),
+            'max_gain_reduction_db': round(float(self.max_reduction_db), 2),
+            'limited_blocks': self.limited_blocks,
+            'latency_ms': round(self.lookahead * 1000 / RATE, 3)
+        }
+
+# Etapa DSP: proceseaza pe loc blocul comun (canale x esantioane) si isi masoara timpul de procesare
+class DSPStage:
+    name = 'stage'
+    latency = 0
+
+    def __init__(self):
+        self.enabled = True
+        self.bypass = False
+        self.calls = 0
+        self.last_time = 0.0
+        self.avg_time = 0.0
+        self.max_time = 0.0
+
+    def process(self, block):
+        pass
+
+    def run(self, block, scratch):
+        if not self.enabled:
+            return
+        start = time.perf_counter()
+        if self.bypass:
+            # in bypass etapa proceseaza o copie ca starea interna sa ramana calda, iesirea nu se foloseste
+            np.copyto(scratch, block)
+            self.process(scratch)
+        else:
+            self.process(block)
+        elapsed = time.perf_counter() - start
+        self.calls += 1
+        self.last_time = elapsed
+        self.avg_time = elapsed if self.calls == 1 else 0.95 * self.avg_time + 0.05 * elapsed
+        self.max_time = max(self.max_time, elapsed)
+
+    def info(self):
+        return {
+            'name': self.name,
+            'enabled': self.enabled,
+            'bypass': self.bypass,
+            'latency_samples': self.latency,
+            'last_ms': round(self.last_time * 1000, 4),
+            'avg_ms': round(self.avg_time * 1000, 4),
+            'max_ms': round(self.max_time * 1000, 4),
+            'calls': self.calls
+        }
+
+class DelayStage(DSPStage):
+    name = 'delay'
+
+    def __init__(self, delay_line):
+        super().__init__()
+        self.delay_line = delay_line
+
+    def process(self, block):
+        self.delay_line.process(block, params['delays'], block)
+
+class GainStage(DSPStage):
+    name = 'gain'
+
+    def __init__(self, channels):
+        super().__init__()
+        self.gains = np.ones((channels, 1), dtype=np.float32)
+
+    def process(self, block):
+        self.gains[:, 0] = params['gains']
+        np.multiply(block, self.gains, out=block)
+
+class ConvolutionStage(DSPStage):
+    name = 'convolution'
+
+    def __init__(self, convolver):
+        super().__init__()
+        self.convolver = convolver
+
+    def process(self, block):
+        self.convolver.set_azimuth(params['azimuth'])
+        self.convolver.process(block, block)
+
+class EQStage(DSPStage):
+    name = 'eq'
+
+    def __init__(self, bank):
+        super().__init__()
+        self.bank = bank
+
+    def process(self, block):
+        self.bank.process(block)
+
+class LimiterStage(DSPStage):
+    name = 'limiter'
+
+    def __init__(self, limiter):
+        super().__init__()
+        self.limiter = limiter
+        self.latency = limiter.lookahead
+
+    def process(self, block):
+        self.limiter.process(block)
+
+    def info(self):
+        info = super().info()
+        info.update(self.limiter.telemetry())
+        return info
+
+# Etapele pe care le poate avea lantul; convolutia exista doar cu HRIR incarcat pe iesire stereo
+DSP_STAGE_NAMES = [stage.name for stage in (DelayStage, GainStage, ConvolutionStage, EQStage, LimiterStage)]
+
+def check_dsp_order(names):
+    # validare fara procesor pornit; cu procesor, DSPChain.reorder cere in plus exact etapele existente
+    required = [name for name in DSP_STAGE_NAMES if name != ConvolutionStage.name]
+    if (not all(isinstance(name, str) for name in names) or len(set(names)) != len(names)
+            or not set(required) <= set(names) <= set(DSP_STAGE_NAMES)):
+        raise ValueError(f"Ordinea trebuie sa contina etapele {required}, optional si {ConvolutionStage.name}")
+
+class DSPChain:
+    def __init__(self, stages, channels, max_block):
+        self.stages = list(stages)
+        self.scratch = np.zeros((channels, max_block), dtype=np.float32)
+
+    def process(self, block):
+        scratch = self.scratch[:, :block.shape[1]]
+        # lista se inlocuieste atomic la reordonare, iteram pe referinta curenta
+        for stage in self.stages:
+            stage.run(block, scratch)
+
+    def stage(self, name):
+        for stage in self.stages:
+            if stage.name == name:
+                return stage
+        return None
+
+    def reorder(self, names):
+        if sorted(names) != sorted(stage.name for stage in self.stages):
+            raise ValueError(f"Ordinea trebuie sa contina exact etapele: {[stage.name for stage in self.stages]}")
+        self.stages = [self.stage(name) for name in names]
+
+    def configure(self, name, enabled=None, bypass=None):
+        stage = self.stage(name)
+        if stage is None:
+            raise KeyError(name)
+        if enabled is not None:
+            stage.enabled = bool(enabled)
+        if bypass is not None:
+            stage.bypass = bool(bypass)
+
+    def apply_settings(self, settings):
+        if settings['order']:
+            known = [name for name in settings['order'] if self.stage(name) is not None]
+            self.reorder(known + [stage.name for stage in self.stages if stage.name not in known])
+        for name, flags in settings['stages'].items():
+            if self.stage(name) is not None:
+                self.configure(name, flags.get('enabled'), flags.get('bypass'))
+
+    def latency(self):
+        return sum(stage.latency for stage in self.stages if stage.enabled and not stage.bypass)
+
+    def info(self):
+        return {'stages': [stage.info() for stage in self.stages], 'latency_samples': self.latency()}
+
+# Coada circulara single-producer/single-consumer de cadre int16 prealocate. Producatorul avanseaza doar
+# write_count, consumatorul doar read_count, deci nu este nevoie de lock intre callback-uri si worker.
+class FrameRing:
+    def __init__(self, slots, frames, channels):
+        self.slots = slots
+        self.data = np.zeros((slots, frames * channels), dtype=np.int16)
+        self.lengths = [0] * slots
+        self.write_count = 0
+        self.read_count = 0
+
+    def available(self):
+        return self.write_count - self.read_count
+
+    def push(self, samples):
+        if self.write_count - self.read_count >= self.slots:
+            return False
+        slot = self.write_count % self.slots
+        self.lengths[slot] = len(samples)
+        self.data[slot, :len(samples)] = samples
+        self.write_count += 1
+        return True
+
+    def peek(self):
+        if self.write_count == self.read_count:
+            return None
+        slot = self.read_count % self.slots
+        return self.data[slot, :self.lengths[slot]]
+
+    def release(self):
+        self.read_count += 1
+
+    def reset(self):
+        # doar cu stream-urile oprite, cand niciun callback nu mai scrie sau citeste
+        self.read_count = self.write_count
+
+# Contoare monotone si ultimele evenimente de glitch ale stream-urilor. record() este apelat si din
+# callback-urile PortAudio, deci face doar o incrementare si un append in deque, fara lock-uri sau I/O.
+class AudioHealth:
+    def __init__(self, maxlen=AUDIO_HEALTH_EVENTS):
+        self.counters = {kind: 0 for kind in AUDIO_EVENT_TYPES}
+        self.events = deque(maxlen=maxlen)
+        self.started = time.time()
+
+    def record(self, kind, detail=None):
+        self.counters[kind] += 1
+        self.events.append((time.time(), kind, detail))
+
+    def xruns(self):
+        c = self.counters
+        return c['input_overflow'] + c['output_underrun'] + c['ring_overflow'] + c['ring_underrun']
+
+    def snapshot(self):
+        return {
+            'counters': dict(self.counters),
+            'xruns': self.xruns(),
+            'uptime_s': time.time() - self.started,
+            'events': [{'time': t, 'clock': time.strftime("%H:%M:%S", time.localtime(t)), 'type': kind, 'detail': detail}
+                       for t, kind, detail in tuple(self.events)]
+        }
+
+# Refacerea stream-urilor cazute: se redeschide doar directia afectata, cu pauze exponentiale (plafonate) intre
+# incercari, fara a inchide instanta PyAudio. Fiecare incident se pastreaza cu durata pana la stream-ul repornit.
+class StreamRecovery:
+    def __init__(self, processor):
+        self.processor = processor
+        self.incidents = deque(maxlen=RECOVERY_INCIDENTS)
+        self.recovered = 0
+        self.failed = 0
+
+    def recover(self, direction, reason):
+        processor = self.processor
+        directions = ('input', 'output') if direction == 'both' else (direction,)
+        processor.health.record('stream_restart', f"{direction}: {reason}")
+        log_debug("audio", f"Refac stream-ul {direction}: {reason}")
+        started = time.perf_counter()
+        wall = time.time()
+        delay = RECOVERY_BASE_DELAY_S
+        attempts = 0
+        error = None
+        while processor.running and SHOULD_RUN:
+            attempts += 1
+            try:
+                if processor.pending_switch is not None:
+                    # dispozitivul cazut a fost inlocuit intre timp de monitorul de hot-plug
+                    processor.apply_device_switch()
+                else:
+                    for name in directions:
+                        processor.reopen_stream(name)
+                duration = time.perf_counter() - started
+                self.recovered += 1
+                self.incidents.append({'time': wall, 'direction': direction, 'reason': reason, 'ok': True,
+                                       'attempts': attempts, 'duration_ms': round(duration * 1000, 3)})
+                log_debug("audio", f"Stream {direction} refacut in {duration * 1000:.1f} ms ({attempts} incercari)")
+                return True
+            except Exception as e:
+                error = str(e)
+                log_debug("audio", f"Incercarea {attempts} pentru stream-ul {direction} a esuat: {e}, reincerc in {delay * 1000:.0f} ms")
+                time.sleep(delay)
+                delay = min(delay * 2, RECOVERY_MAX_DELAY_S)
+        # procesarea s-a oprit inainte ca stream-ul sa revina
+        self.failed += 1
+        self.incidents.append({'time': wall, 'direction': direction, 'reason': reason, 'ok': False, 'attempts': attempts,
+                               'duration_ms': round((time.perf_counter() - started) * 1000, 3), 'error': error})
+        return False
+
+    def snapshot(self):
+        incidents = tuple(self.incidents)
+        durations = [incident['duration_ms'] for incident in incidents if incident['ok']]
+        return {
+            'recovered': self.recovered,
+            'failed': self.failed,
+            'last_ms': durations[-1] if durations else None,
+            'max_ms': max(durations) if durations else None,
+            'incidents': list(incidents)
+        }
+
+# Alege frames_per_buffer dintr-o scara de dimensiuni dublate de la minim (toate multipli ai partitiei de
+# convolutie): creste la orice xrun sau cand DSP-ul consuma prea mult din durata blocului, scade doar dupa
+# o perioada fara probleme. Daca blocul micsorat produce din nou xrun-uri, perioada de asteptare se dubleaza.
+class BlockSizeController:
+    def __init__(self, minimum, maximum):
+        self.sizes = [minimum]
+        while self.sizes[-1] * 2 <= maximum:
+            self.sizes.append(self.sizes[-1] * 2)
+        self.index = 0
+        self.size = self.sizes[0]
+        self.hold = ADAPTIVE_DOWN_HOLD_S
+        self.changed_at = time.time()
+        self.stepped_down = False
+        self.xrun_base = 0
+        self.peak_load = 0.0
+        self.changes = 0
+
+    def report(self, seconds, frames):
+        self.peak_load = max(self.peak_load, seconds * RATE / frames)
+
+    def update(self, xruns):
+        elapsed = time.time() - self.changed_at
+        if elapsed < ADAPTIVE_SETTLE_S:
+            self.xrun_base = xruns
+            self.peak_load = 0.0
+            return None
+        if xruns > self.xrun_base or self.peak_load > ADAPTIVE_HIGH_LOAD:
+            if self.stepped_down and elapsed < self.hold:
+                self.hold = min(self.hold * 2, ADAPTIVE_MAX_HOLD_S)
+            return self.step(1, xruns)
+        if elapsed >= self.hold:
+            return self.step(-1 if self.peak_load < ADAPTIVE_LOW_LOAD else 0, xruns)
+        return None
+
+    def step(self, direction, xruns):
+        self.index = min(max(self.index + direction, 0), len(self.sizes) - 1)
+        self.stepped_down = direction < 0
+        self.changed_at = time.time()
+        self.xrun_base = xruns
+        self.peak_load = 0.0
+        if self.sizes[self.index] == self.size:
+            return None
+        self.size = self.sizes[self.index]
+        self.changes += 1
+        return self.size
+
+# Resampler fractionar pentru corectia de drift: produce blocuri de lungime fixa consumand ratio cadre de
+# intrare per cadru de iesire, cu interpolare Lagrange de ordin 3 (esantioanele -1..2 in jurul pozitiei).
+# Ponderile sunt polinoame in fractiunea t, deci se obtin dintr-o singura inmultire cu [1, t, t^2, t^3].
+# Pozitia de citire ramane in float64 relativ la inceputul buffer-ului, care se compacteaza doar ocazional.
+class FractionalResampler:
+    def __init__(self, channels, max_block, capacity_blocks=8):
+        self.channels = channels
+        self.polynomials = np.array([[0.0, -1 / 3, 1 / 2, -1 / 6],
+                                     [1.0, -1 / 2, -1.0, 1 / 2],
+                                     [0.0, 1.0, 1 / 2, -1 / 2],
+                                     [0.0, -1 / 6, 0.0, 1 / 6]], dtype=np.float32)
+        self.size = capacity_blocks * max_block + 4
+        self.buffer = np.zeros((channels, self.size), dtype=np.float32)
+        self.ratio = 1.0
+        self.steps = np.arange(max_block, dtype=np.float64)
+        self.points = np.zeros(max_block, dtype=np.float64)
+        self.whole = np.zeros(max_block, dtype=np.float64)
+        self.powers = np.ones((4, max_block), dtype=np.float32)
+        self.weights = np.zeros((4, max_block), dtype=np.float32)
+        self.index = np.zeros(max_block, dtype=np.int64)
+        self.offsets = np.arange(-1, 3)[:, None]
+        self.tap_index = np.zeros((4, max_block), dtype=np.int64)
+        self.taps = np.zeros((channels, 4, max_block), dtype=np.float32)
+        self.reset()
+
+    def reset(self):
+        # un cadru de istoric (zero) inaintea pozitiei, necesar esantionului -1 al interpolarii
+        self.end = 1
+        self.position = 1.0
+        self.pulls = 0
+
+    def primed(self):
+        # dupa primul bloc scos, backlog-ul ramas este cel normal, nu cel gol de la pornire
+        return self.pulls > 0
+
+    def backlog(self):
+        return self.end - self.position
+
+    def compact(self):
+        keep = int(self.position) - 1
+        remaining = self.end - keep
+        self.buffer[:, :remaining] = self.buffer[:, keep:self.end]
+        self.end = remaining
+        self.position -= keep
+
+    def push(self, samples):
+        n = len(samples) // self.channels
+        if self.end + n > self.size:
+            self.compact()
+        if self.end + n > self.size:
+            return False
+        np.copyto(self.buffer[:, self.end:self.end + n], samples.reshape(n, self.channels).T)
+        self.end += n
+        return True
+
+    def ready(self, n):
+        return self.position + (n - 1) * self.ratio + 2 < self.end
+
+    def pull(self, out):
+        n = out.shape[1]
+        points, whole, index = self.points[:n], self.whole[:n], self.index[:n]
+        powers, weights = self.powers[:, :n], self.weights[:, :n]
+        tap_index, taps = self.tap_index[:, :n], self.taps[:, :, :n]
+        np.multiply(self.steps[:n], self.ratio, out=points)
+        points += self.position
+        np.floor(points, out=whole)
+        np.copyto(index, whole, casting='unsafe')
+        np.subtract(points, whole, out=powers[1])
+        np.multiply(powers[1], powers[1], out=powers[2])
+        np.multiply(powers[2], powers[1], out=powers[3])
+        np.matmul(self.polynomials, powers, out=weights)
+        np.add(index, self.offsets, out=tap_index)
+        np.take(self.buffer, tap_index, axis=1, out=taps)
+        np.einsum('ckn,kn->cn', taps, weights, out=out)
+        self.position += n * self.ratio
+        self.pulls += 1
+
+# Estimeaza drift-ul dintre ceasuri din nivelul de umplere (cadre aflate intre captura si redare) si il
+# compenseaza cu un regulator PI in ppm. Termenul integral converge la drift-ul real al ceasurilor, iar
+# tinta este nivelul de la pornire, deci latenta totala ramane constanta. Media porneste doar cu resampler-ul
+# amorsat, iar tinta se fixeaza dupa cel putin trei constante de timp, cand media a ajuns la nivelul stabil.
+class DriftEstimator:
+    def __init__(self):
+        self.integral = 0.0
+        self.ppm = 0.0
+        self.restart()
+
+    def restart(self):
+        # dupa redeschiderea stream-urilor nivelul de baza se schimba; drift-ul estimat (integrala) ramane
+        self.last = None
+        self.level = None
+        self.target = None
+
+    def update(self, fill, primed=True):
+        now = time.monotonic()
+        if self.last is None:
+            if not primed:
+                return self.ppm
+            self.started = self.last = now
+            self.level = float(fill)
+            return self.ppm
+        dt = now - self.last
+        self.last = now
+        self.level += min(1.0, dt / DRIFT_SMOOTHING_S) * (fill - self.level)
+        if self.target is None:
+            if now - self.started >= max(DRIFT_SETTLE_S, 3 * DRIFT_SMOOTHING_S):
+                self.target = self.level
+            return self.ppm
+        error = self.level - self.target
+        integral = self.integral + error * dt
+        ppm = DRIFT_KP * error + DRIFT_KI * integral
+        # anti-windup: integrala nu mai creste cat timp corectia este saturata
+        if abs(ppm) <= DRIFT_MAX_PPM:
+            self.integral = integral
+        self.ppm = min(max(ppm, -DRIFT_MAX_PPM), DRIFT_MAX_PPM)
+        return self.ppm
+
+    def info(self):
+        return {
+            'correction_ppm': self.ppm,
+            'drift_ppm': DRIFT_KI * self.integral,
+            'level_frames': self.level,
+            'target_frames': self.target
+        }
+
 class AudioProcessor:
     def __init__(self, p):
         self.p = p
@@ -256,99 +2165,354 @@ class AudioProcessor:
         LOOPBACK_DEVICE_INDEX, IQAUDIO_DEVICE_INDEX = find_audio_devices(self.p)
         if LOOPBACK_DEVICE_INDEX is None or IQAUDIO_DEVICE_INDEX is None:
             log_debug("audio", "Dispozitive loopback sau output lipsa!")
-            self.p.terminate()
             raise ValueError("Dispozitive audio necesare lipsesc")
+        # matricea de rutare intrare -> iesire; None cand iesirea este chiar intrarea stereo
+        self.mix = None
+        if OUTPUT_LAYOUT:
+            _, self.mix = build_output_routing(OUTPUT_LAYOUT, CHANNELS)
+            log_debug("audio", f"Rutare multicanal: {CHANNELS} -> {OUTPUT_CHANNELS} canale")
         self.stream_in = None
         self.stream_out = None
+        # in modul adaptiv tot DSP-ul este dimensionat pentru blocul maxim si lucreaza pe vederi [:, :n]
+        self.adaptive = BlockSizeController(ADAPTIVE_MIN_CHUNK, ADAPTIVE_MAX_CHUNK) if ADAPTIVE_BUFFER else None
+        self.block_sizes = self.adaptive.sizes if self.adaptive else [CHUNK]
+        self.max_block = self.block_sizes[-1]
+        self.block_size = self.block_sizes[0]
+        self.health = AudioHealth()
+        self.recovery = StreamRecovery(self)
+        self.pending_switch = None
+        self.scheduling = {}
+        self.last_block_log = 0.0
+        self.control = None
+        self.meters = None
+        self.callback_scheduled = {'input': False, 'output': False}
+        self.resampler = FractionalResampler(CHANNELS, self.max_block) if DRIFT_COMPENSATION else None
+        self.drift = DriftEstimator() if DRIFT_COMPENSATION else None
+        self.callback_mode = AUDIO_IO_MODE == 'callback'
+        if self.callback_mode:
+            self.in_ring = FrameRing(AUDIO_RING_BLOCKS, self.max_block, CHANNELS)
+            self.out_ring = FrameRing(AUDIO_RING_BLOCKS, self.max_block, OUTPUT_CHANNELS)
+            self.input_ready = threading.Event()
+            self.last_in = np.zeros(self.max_block * CHANNELS, dtype=np.int16)
+            self.last_out = np.zeros(self.max_block * OUTPUT_CHANNELS, dtype=np.int16)
+            self.last_frames = self.block_size
+        self.delay_line = DelayLine(OUTPUT_CHANNELS, MAX_DELAY_SAMPLES, self.max_block)
+        # buffere de lucru prealocate: conversia int16 <-> float32 se face pe loc, fara alocari in thread-ul audio
+        self.input = np.zeros((CHANNELS, self.max_block), dtype=np.float32)
+        self.work = np.zeros((OUTPUT_CHANNELS, self.max_block), dtype=np.float32)
+        self.output = np.zeros((self.max_block, OUTPUT_CHANNELS), dtype=np.int16)
+        stages = [DelayStage(self.delay_line), GainStage(OUTPUT_CHANNELS)]
+        if HRIR_FILE and OUTPUT_CHANNELS != 2:
+            log_debug("audio", "Convolutia HRIR necesita iesire stereo, o ignor in modul multicanal")
+        elif HRIR_FILE:
+            try:
+                stages.append(ConvolutionStage(PartitionedConvolver(HRIRSet.load(HRIR_FILE), OUTPUT_CHANNELS, self.block_sizes[0])))
+            except Exception as e:
+                log_debug("audio", f"Eroare la incarcarea HRIR din {HRIR_FILE}: {e}, continui fara convolutie")
+        self.eq = BiquadBank(OUTPUT_CHANNELS, self.block_sizes)
+        try:
+            self.eq.set_bands(EQ_BANDS)
+        except (KeyError, ValueError) as e:
+            log_debug("audio", f"Benzi EQ invalide: {e}, EQ dezactivat")
+        stages.append(EQStage(self.eq))
+        self.limiter = LookaheadLimiter(OUTPUT_CHANNELS, self.max_block)
+        stages.append(LimiterStage(self.limiter))
+        self.chain = DSPChain(stages, OUTPUT_CHANNELS, self.max_block)
+        self.chain.apply_settings(DSP_CHAIN_SETTINGS)
         self.initialize_streams()
-        max_delay = 2205
-        self.delay_buffer = np.zeros((2, max_delay + CHUNK))
-        self.delay_index = 0
 
-    def initialize_streams(self):
-        try:
-            if self.stream_in:
-                if self.stream_in.is_active():
-                    self.stream_in.stop_stream()
-                self.stream_in.close()
-                self.stream_in = None
-            if self.stream_out:
-                if self.stream_out.is_active():
-                    self.stream_out.stop_stream()
-                self.stream_out.close()
-                self.stream_out = None
+    def open_stream(self, direction):
+        self.callback_scheduled[direction] = False
+        # dupa o re-enumerare fara dispozitivul configurat nu deschidem dispozitivul implicit in locul lui
+        if (LOOPBACK_DEVICE_INDEX if direction == 'input' else IQAUDIO_DEVICE_INDEX) is None:
+            raise OSError(f"Dispozitivul de {direction} lipseste")
+        if direction == 'input':
             self.stream_in = self.p.open(
                 format=FORMAT,
                 channels=CHANNELS,
                 rate=RATE,
                 input=True,
                 input_device_index=LOOPBACK_DEVICE_INDEX,
-                frames_per_buffer=CHUNK,
-                start=False
-            )
-            self.stream_out = self.p.open(
-                format=FORMAT,
-                channels=CHANNELS,
-                rate=RATE,
-                output=True,
-                output_device_index=IQAUDIO_DEVICE_INDEX,
-                frames_per_buffer=CHUNK,
-                start=False
+                frames_per_buffer=self.block_size,
+                start=False,
+                stream_callback=self.input_callback if self.callback_mode else None
             )
+            return self.stream_in
+        self.stream_out = self.p.open(
+            format=FORMAT,
+            channels=OUTPUT_CHANNELS,
+            rate=RATE,
+            output=True,
+            output_device_index=IQAUDIO_DEVICE_INDEX,
+            frames_per_buffer=self.block_size,
+            start=False,
+            stream_callback=self.output_callback if self.callback_mode else None
+        )
+        return self.stream_out
+
+    def close_stream(self, direction):
+        if direction == 'input':
+            stream, self.stream_in = self.stream_in, None
+        else:
+            stream, self.stream_out = self.stream_out, None
+        if stream is None:
+            return
+        try:
+            if stream.is_active():
+                stream.stop_stream()
+            stream.close()
+            log_debug("audio", f"Stream {direction} inchis")
+        except Exception as e:
+            log_debug("audio", f"Eroare la inchiderea stream-ului {direction}: {e}")
+
+    def reopen_stream(self, direction):
+        # doar directia cazuta; cealalta continua, iar instanta PyAudio ramane deschisa
+        self.close_stream(direction)
+        self.open_stream(direction).start_stream()
+        if self.drift is not None:
+            self.drift.restart()
+
+    def request_device_switch(self):
+        # apelat din thread-ul de monitorizare; re-enumerarea propriu-zisa o face thread-ul audio intre blocuri
+        done = threading.Event()
+        self.pending_switch = done
+        return done
+
+    def apply_device_switch(self):
+        # PortAudio re-scaneaza dispozitivele doar cand Pa_Initialize porneste fara alta instanta deschisa, asa ca
+        # se inchid intai stream-urile si instanta veche, apoi se enumereaza cu una noua; audio-ul se opreste
+        # pe durata re-enumerarii
+        global LOOPBACK_DEVICE_INDEX, IQAUDIO_DEVICE_INDEX, p_proc
+        done, self.pending_switch = self.pending_switch, None
+        try:
+            self.close_stream('input')
+            self.close_stream('output')
+            self.p.terminate()
+            self.p = p_proc = create_audio_backend()
+            DEVICE_REGISTRY.refresh(self.p)
+            LOOPBACK_DEVICE_INDEX, IQAUDIO_DEVICE_INDEX = DEVICE_REGISTRY.resolve()
+            if LOOPBACK_DEVICE_INDEX is None or IQAUDIO_DEVICE_INDEX is None:
+                raise OSError("Dispozitivele configurate lipsesc, astept reconectarea")
+            self.initialize_streams(f"dispozitive re-enumerate: hw {LOOPBACK_DEVICE_INDEX} -> {IQAUDIO_DEVICE_INDEX}")
+        finally:
+            done.set()
+
+    def initialize_streams(self, reason=None):
+        if reason:
+            self.health.record('stream_restart', reason)
+        try:
+            self.close_stream('input')
+            self.close_stream('output')
+            if self.callback_mode:
+                self.reset_rings()
+            if self.resampler is not None:
+                self.resampler.reset()
+                self.drift.restart()
+            self.open_stream('input')
+            self.open_stream('output')
             self.stream_in.start_stream()
             self.stream_out.start_stream()
-            log_debug("audio", "Stream-uri audio pornite")
+            log_debug("audio", f"Stream-uri audio pornite, {self.block_size} cadre per buffer")
         except Exception as e:
             log_debug("audio", f"Eroare la initializarea stream-urilor: {e}")
-            self.cleanup()
+            self.close_stream('input')
+            self.close_stream('output')
             raise
 
+    def reset_rings(self):
+        self.in_ring.reset()
+        self.out_ring.reset()
+        if CALLBACK_DSP == 'worker':
+            prefill = np.zeros(self.block_size * OUTPUT_CHANNELS, dtype=np.int16)
+            for _ in range(AUDIO_RING_PREFILL):
+                self.out_ring.push(prefill)
+        else:
+            prefill = np.zeros(self.block_size * CHANNELS, dtype=np.int16)
+            for _ in range(AUDIO_RING_PREFILL):
+                self.in_ring.push(prefill)
+        self.silence = bytes(self.block_size * OUTPUT_CHANNELS * 2)
+
     def process_binaural_audio(self, data):
-        global params
-        audio_array = np.frombuffer(data, dtype=np.int16).astype(np.float32)
-        if len(audio_array) < CHUNK * CHANNELS:
+        samples = np.frombuffer(data, dtype=np.int16)
+        if len(samples) < self.block_size * CHANNELS:
             log_debug("audio", "Date audio incomplete, returnez nemodificate")
             return data
+        return self.process_block(samples).tobytes()
 
-        left = audio_array[::2].copy()
-        right = audio_array[1::2].copy()
-        chunk_size = len(left)
-
-        start_idx = self.delay_index
-        end_idx = start_idx + chunk_size
-        if end_idx > len(self.delay_buffer[0]):
-            first_part = len(self.delay_buffer[0]) - start_idx
-            self.delay_buffer[0, start_idx:] = left[:first_part]
-            self.delay_buffer[1, start_idx:] = right[:first_part]
-            remaining = chunk_size - first_part
-            self.delay_buffer[0, :remaining] = left[first_part:]
-            self.delay_buffer[1, :remaining] = right[first_part:]
+    def process_block(self, samples=None):
+        start = time.perf_counter()
+        if self.control is not None:
+            self.control.read(params)
+        if samples is None:
+            # bloc produs de resampler-ul de drift din cadrele de intrare deja acumulate
+            n = self.block_size
+            source = self.work[:, :n] if self.mix is None else self.input[:, :n]
+            self.resampler.pull(source)
         else:
-            self.delay_buffer[0, start_idx:end_idx] = left
-            self.delay_buffer[1, start_idx:end_idx] = right
+            n = min(len(samples) // CHANNELS, self.max_block)
+            source = self.work[:, :n] if self.mix is None else self.input[:, :n]
+            np.copyto(source, samples[:n * CHANNELS].reshape(n, CHANNELS).T)
+        work = self.work[:, :n]
+        if self.mix is not None:
+            np.matmul(self.mix, source, out=work)
+        self.chain.process(work)
+
+        np.clip(work, -32767, 32767, out=work)
+        output = self.output[:n]
+        np.copyto(output.T, work, casting='unsafe')
+        elapsed = time.perf_counter() - start
+        if elapsed * RATE > n:
+            self.health.record('deadline_miss', round(elapsed * 1000, 3))
+        if self.adaptive is not None:
+            self.adaptive.report(elapsed, n)
+        # log-ul din thread-ul audio se scrie cel mult o data pe secunda, nu la fiecare bloc
+        if not self.callback_mode and start - self.last_block_log >= 1.0:
+            self.last_block_log = start
+            log_debug("audio", f"Procesare audio: delay_l={params['delay_l']:.3f} samples, delay_r={params['delay_r']:.3f} samples")
+        return output
+
+    def update_drift(self, fill):
+        self.resampler.ratio = 1.0 + self.drift.update(fill + self.resampler.backlog(), self.resampler.primed()) * 1e-6
 
-        delay_idx_l = (start_idx - params['delay_l']) % len(self.delay_buffer[0])
-        delay_idx_r = (start_idx - params['delay_r']) % len(self.delay_buffer[0])
+    def process_drift(self, data_in):
+        # blocking: intre ceasuri stau cadrele neconsumate din intrare plus cele inca neredate din iesire
+        self.resampler.push(np.frombuffer(data_in, dtype=np.int16))
+        self.update_drift(self.stream_in.get_read_available() - self.stream_out.get_write_available())
+        data_out = None
+        while self.resampler.ready(self.block_size):
+            data_out = self.process_block().tobytes()
+            self.write_block(data_out)
+        return data_out
 
-        delayed_left = np.zeros(chunk_size, dtype=np.float32)
-        delayed_right = np.zeros(chunk_size, dtype=np.float32)
+    def adapt_block_size(self):
+        size = self.adaptive.update(self.health.xruns())
+        if size is None:
+            return
+        log_debug("audio", f"Bloc adaptiv: {self.block_size} -> {size} cadre")
+        self.block_size = size
+        self.initialize_streams(f"bloc {size}")
+
+    def read_block(self):
+        # cu exceptie PyAudio ar arunca blocul deja citit, deci overflow-ul se deduce inainte de citire: daca in
+        # bufferul PortAudio asteapta cel putin cat latenta de intrare, bufferul e plin si dispozitivul pierde cadre
+        stream = self.stream_in
+        available = stream.get_read_available()
+        if available >= max(self.block_size, int(stream.get_input_latency() * RATE)):
+            self.health.record('input_overflow', available)
+        return stream.read(self.block_size, exception_on_overflow=False)
+
+    def write_block(self, data):
+        try:
+            self.stream_out.write(data, exception_on_underflow=True)
+        except OSError as e:
+            if e.errno != pyaudio.paOutputUnderflowed:
+                raise
+            self.health.record('output_underrun', self.block_size)
 
-        for i in range(chunk_size):
-            idx_l = (delay_idx_l + i) % len(self.delay_buffer[0])
-            idx_r = (delay_idx_r + i) % len(self.delay_buffer[0])
-            delayed_left[i] = self.delay_buffer[0, idx_l]
-            delayed_right[i] = self.delay_buffer[1, idx_r]
+    def latency_info(self):
+        # latenta intrare -> iesire: bufferele raportate de PortAudio, blocul in lucru, coada callback si DSP
+        stream_in, stream_out = self.stream_in, self.stream_out
+        stream_s = 0.0
+        if stream_in and stream_out:
+            stream_s = stream_in.get_input_latency() + stream_out.get_output_latency()
+        queued = AUDIO_RING_PREFILL * self.block_size if self.callback_mode else 0
+        if self.resampler is not None:
+            queued += self.resampler.backlog()
+        dsp = self.chain.latency()
+        return {
+            'adaptive': self.adaptive is not None,
+            'block_size': self.block_size,
+            'block_sizes': self.block_sizes,
+            'block_ms': self.block_size * 1000 / RATE,
+            'stream_latency_ms': stream_s * 1000,
+            'dsp_latency_ms': dsp * 1000 / RATE,
+            'total_latency_ms': stream_s * 1000 + (self.block_size + queued + dsp) * 1000 / RATE,
+            'xruns': self.health.xruns(),
+            'peak_load': self.adaptive.peak_load if self.adaptive else None,
+            'changes': self.adaptive.changes if self.adaptive else 0,
+            'drift': self.drift.info() if self.drift else None
+        }
 
-        left = delayed_left
-        right = delayed_right
+    # Callback-urile ruleaza in thread-urile PortAudio: doar copiere in/din cozi, fara log-uri sau emit
+    def input_callback(self, in_data, frame_count, time_info, status):
+        if not self.callback_scheduled['input']:
+            self.callback_scheduled['input'] = True
+            self.scheduling['input_callback'] = apply_realtime_policy('input_callback')
+        if status & pyaudio.paInputOverflow:
+            self.health.record('input_overflow', frame_count)
+        if not self.in_ring.push(np.frombuffer(in_data, dtype=np.int16)):
+            self.health.record('ring_overflow', frame_count)
+        self.input_ready.set()
+        return (None, pyaudio.paContinue)
 
-        self.delay_index = (self.delay_index + chunk_size) % len(self.delay_buffer[0])
+    def output_callback(self, in_data, frame_count, time_info, status):
+        if not self.callback_scheduled['output']:
+            self.callback_scheduled['output'] = True
+            self.scheduling['output_callback'] = apply_realtime_policy('output_callback')
+        if status & pyaudio.paOutputUnderflow:
+            self.health.record('output_underrun', frame_count)
+        if CALLBACK_DSP == 'callback' and self.resampler is not None:
+            while not self.resampler.ready(frame_count) and self.in_ring.available():
+                samples = self.in_ring.peek()
+                n = len(samples)
+                self.last_in[:n] = samples
+                self.in_ring.release()
+                self.last_frames = n // CHANNELS
+                self.resampler.push(self.last_in[:n])
+            if not self.resampler.ready(frame_count):
+                self.health.record('ring_underrun', frame_count)
+                return (self.silence, pyaudio.paContinue)
+            output = self.process_block().reshape(-1)
+            self.last_out[:len(output)] = output
+            return (output.tobytes(), pyaudio.paContinue)
+        if CALLBACK_DSP == 'callback':
+            samples = self.in_ring.peek()
+            if samples is None:
+                self.health.record('ring_underrun', frame_count)
+                return (self.silence, pyaudio.paContinue)
+            n = len(samples)
+            self.last_in[:n] = samples
+            self.in_ring.release()
+            output = self.process_block(self.last_in[:n]).reshape(-1)
+            self.last_out[:len(output)] = output
+            self.last_frames = n // CHANNELS
+            return (output.tobytes(), pyaudio.paContinue)
+        samples = self.out_ring.peek()
+        if samples is None:
+            self.health.record('ring_underrun', frame_count)
+            return (self.silence, pyaudio.paContinue)
+        data = samples.tobytes()
+        self.out_ring.release()
+        return (data, pyaudio.paContinue)
 
-        output = np.zeros_like(audio_array)
-        output[::2] = np.clip(left, -32767, 32767)
-        output[1::2] = np.clip(right, -32767, 32767)
-        log_debug("audio", f"Procesare audio: delay_l={params['delay_l']} samples, delay_r={params['delay_r']} samples")
-        return output.astype(np.int16).tobytes()
+    def process_pending(self):
+        # worker: proceseaza tot ce a produs callback-ul de intrare, cat timp exista loc in coada de iesire
+        while self.out_ring.available() < self.out_ring.slots:
+            if self.resampler is not None and self.resampler.ready(self.block_size):
+                output = self.process_block().reshape(-1)
+            elif self.in_ring.available():
+                samples = self.in_ring.peek()
+                n = len(samples)
+                self.last_in[:n] = samples
+                self.in_ring.release()
+                self.last_frames = n // CHANNELS
+                if self.resampler is not None:
+                    self.resampler.push(self.last_in[:n])
+                    continue
+                output = self.process_block(self.last_in[:n]).reshape(-1)
+            else:
+                break
+            self.last_out[:len(output)] = output
+            self.out_ring.push(output)
+
+    def health_info(self):
+        return {**self.health.snapshot(), 'recovery': self.recovery.snapshot(), 'scheduling': dict(self.scheduling)}
+
+    def emit_audio_telemetry(self, audio_array_in, audio_array_out):
+        if self.meters is not None:
+            self.meters.push(audio_array_in, audio_array_out)
+        else:
+            emit_audio_levels(audio_array_in, audio_array_out)
 
     def cleanup(self):
         log_debug("audio", "Incep cleanup AudioProcessor...")
@@ -358,24 +2522,8 @@ class AudioProcessor:
             self.audio_thread.join(timeout=2.0)
             if self.audio_thread.is_alive():
                 log_debug("audio", "Thread-ul audio nu s-a oprit in timp util")
-        try:
-            if hasattr(self, 'stream_in') and self.stream_in:
-                if self.stream_in.is_active():
-                    self.stream_in.stop_stream()
-                self.stream_in.close()
-                self.stream_in = None
-                log_debug("audio", "Stream input inchis")
-        except Exception as e:
-            log_debug("audio", f"Eroare la inchiderea stream_in: {e}")
-        try:
-            if hasattr(self, 'stream_out') and self.stream_out:
-                if self.stream_out.is_active():
-                    self.stream_out.stop_stream()
-                self.stream_out.close()
-                self.stream_out = None
-                log_debug("audio", "Stream output inchis")
-        except Exception as e:
-            log_debug("audio", f"Eroare la inchiderea stream_out: {e}")
+        self.close_stream('input')
+        self.close_stream('output')
         time.sleep(0.1)
         log_debug("audio", "Cleanup AudioProcessor complet")
 
@@ -394,37 +2542,46 @@ class AudioProcessor:
                 self.audio_thread.join(timeout=2.0)
 
     def run(self):
-        global SHOULD_RUN, LAST_AUDIO_UPDATE
+        global SHOULD_RUN
         log_debug("audio", f"Rutare sunet de la hw:{LOOPBACK_DEVICE_INDEX} la hw:{IQAUDIO_DEVICE_INDEX}")
+        self.scheduling['audio'] = apply_realtime_policy('worker' if self.callback_mode else 'audio')
+        if self.callback_mode:
+            self.run_callback()
+            return
         while self.running and SHOULD_RUN:
             try:
+                if self.pending_switch is not None:
+                    self.apply_device_switch()
+                    continue
                 if not self.stream_in or not self.stream_in.is_active():
-                    log_debug("audio", "Stream input inactiv, reinitializez")
-                    self.initialize_streams()
+                    self.recovery.recover('input', "input inactiv")
+                    continue
+                if not self.stream_out or not self.stream_out.is_active():
+                    self.recovery.recover('output', "output inactiv")
+                    continue
+                try:
+                    data_in = self.read_block()
+                except OSError as e:
+                    self.recovery.recover('input', f"eroare la citire: {e}")
                     continue
-                data_in = self.stream_in.read(CHUNK, exception_on_overflow=False)
                 if not self.running or not SHOULD_RUN:
                     break
-                data_out = self.process_binaural_audio(data_in)
-                if not self.stream_out or not self.stream_out.is_active():
-                    log_debug("audio", "Stream output inactiv, reinitializez")
-                    self.initialize_streams()
+                try:
+                    if self.resampler is None:
+                        data_out = self.process_binaural_audio(data_in)
+                        self.write_block(data_out)
+                    else:
+                        data_out = self.process_drift(data_in)
+                except OSError as e:
+                    self.recovery.recover('output', f"eroare la scriere: {e}")
                     continue
-                self.stream_out.write(data_out)
-                if time.time() - LAST_AUDIO_UPDATE >= 0.1:
-                    audio_array_in = np.frombuffer(data_in, dtype=np.int16)
-                    audio_array_out = np.frombuffer(data_out, dtype=np.int16)
-                    socketio.emit('data_input', {'input': audio_array_in.tolist(), 'max_amplitude': int(np.max(np.abs(audio_array_in)))})
-                    socketio.emit('data_output', {'output': audio_array_out.tolist(), 'max_amplitude': int(np.max(np.abs(audio_array_out))), 'anomalies': []})
-                    LAST_AUDIO_UPDATE = time.time()
+                if data_out is not None:
+                    self.emit_audio_telemetry(np.frombuffer(data_in, dtype=np.int16), np.frombuffer(data_out, dtype=np.int16))
+                if self.adaptive is not None:
+                    self.adapt_block_size()
             except OSError as e:
                 if self.running and SHOULD_RUN:
-                    log_debug("audio", f"Eroare la citire: {e}, reinitializez")
-                    try:
-                        self.initialize_streams()
-                    except Exception as init_error:
-                        log_debug("audio", f"Eroare la reinitializare: {init_error}")
-                        time.sleep(0.1)
+                    self.recovery.recover('both', f"eroare: {e}")
                 continue
             except Exception as e:
                 if self.running and SHOULD_RUN:
@@ -432,6 +2589,341 @@ class AudioProcessor:
                 continue
         log_debug("audio", "Thread audio oprit complet.")
 
+    def run_callback(self):
+        # in modul callback thread-ul audio este worker-ul DSP (daca e cazul) si supravegheaza stream-urile
+        log_debug("audio", f"Mod callback, DSP in {CALLBACK_DSP}")
+        while self.running and SHOULD_RUN:
+            try:
+                if self.pending_switch is not None:
+                    self.apply_device_switch()
+                    continue
+                if not self.stream_in or not self.stream_in.is_active():
+                    self.recovery.recover('input', "callback input inactiv")
+                    continue
+                if not self.stream_out or not self.stream_out.is_active():
+                    self.recovery.recover('output', "callback output inactiv")
+                    continue
+                if CALLBACK_DSP == 'worker':
+                    if self.input_ready.wait(timeout=0.1):
+                        self.input_ready.clear()
+                        self.process_pending()
+                else:
+                    time.sleep(0.05)
+                if self.resampler is not None:
+                    # in modul callback nivelul este dat de blocurile din cele doua cozi
+                    self.update_drift((self.in_ring.available() + self.out_ring.available()) * self.block_size)
+                self.emit_audio_telemetry(self.last_in[:self.last_frames * CHANNELS], self.last_out[:self.last_frames * OUTPUT_CHANNELS])
+                if self.adaptive is not None:
+                    self.adapt_block_size()
+            except OSError as e:
+                if self.running and SHOULD_RUN:
+                    self.recovery.recover('both', f"eroare stream callback: {e}")
+            except Exception as e:
+                if self.running and SHOULD_RUN:
+                    log_debug("audio", f"Eroare neasteptata: {e}")
+        log_debug("audio", "Thread audio oprit complet.")
+
+def emit_audio_levels(audio_array_in, audio_array_out):
+    global LAST_AUDIO_UPDATE
+    if time.time() - LAST_AUDIO_UPDATE >= 0.1:
+        socketio.emit('data_input', {'input': audio_array_in.tolist(), 'max_amplitude': int(np.max(np.abs(audio_array_in)))})
+        socketio.emit('data_output', {'output': audio_array_out.tolist(), 'max_amplitude': int(np.max(np.abs(audio_array_out))), 'anomalies': []})
+        LAST_AUDIO_UPDATE = time.time()
+
+# Bloc de control in memorie partajata: procesul web scrie params, thread-ul audio al procesului audio le
+# citeste la fiecare bloc. Protocol seqlock: scriitorul face seq impar, scrie campurile, apoi seq par;
+# cititorul reincearca daca seq era impar sau s-a schimbat in timpul copierii si nu asteapta niciodata.
+class AudioControlBlock:
+    def __init__(self, channels, name=None):
+        self.dtype = np.dtype([('seq', np.uint64), ('running', np.uint8), ('azimuth', np.float64),
+                               ('delays', np.float64, (channels,)), ('gains', np.float64, (channels,))], align=True)
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=self.dtype.itemsize)
+        self.name = self.shm.name
+        self.block = np.ndarray((), dtype=self.dtype, buffer=self.shm.buf)
+        self.copy = np.zeros((), dtype=self.dtype)
+        self.seen = 0
+        self.lock = threading.Lock()
+
+    def publish(self, values, running):
+        # lock-ul serializeaza doar scriitorii din procesul web, cititorul nu il foloseste
+        with self.lock:
+            seq = int(self.block['seq'])
+            self.block['seq'] = seq + 1
+            self.block['running'] = running
+            self.block['azimuth'] = values['azimuth']
+            self.block['delays'] = values['delays']
+            self.block['gains'] = values['gains']
+            self.block['seq'] = seq + 2
+
+    def running(self):
+        return bool(self.block['running'])
+
+    def read(self, target):
+        for _ in range(CONTROL_READ_RETRIES):
+            seq = int(self.block['seq'])
+            if seq & 1:
+                continue
+            self.copy[...] = self.block
+            if int(self.block['seq']) != seq:
+                continue
+            if seq != self.seen:
+                self.seen = seq
+                delays, gains = self.copy['delays'].tolist(), self.copy['gains'].tolist()
+                right = min(1, len(delays) - 1)
+                target.update(delays=delays, gains=gains, azimuth=float(self.copy['azimuth']),
+                              delay_l=delays[0], delay_r=delays[right], gain_l=gains[0], gain_r=gains[right],
+                              running=bool(self.copy['running']))
+            return True
+        return False
+
+    def close(self, unlink=False):
+        # view-urile numpy tin buffer-ul exportat, trebuie eliberate inainte de close
+        self.block = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+# Inel de metering: procesul audio scrie la fiecare bloc esantioanele de intrare si iesire intr-un slot,
+# procesul web citeste cel mai recent slot complet. Fiecare slot are propriul seq, deci un slot rescris
+# in timpul citirii este sarit, iar scriitorul nu asteapta niciodata cititorul.
+class MeterRing:
+    def __init__(self, slots, max_block, name=None):
+        dtype = np.dtype([('seq', np.uint64), ('lengths', np.uint32, (2,)), ('input', np.int16, (max_block * CHANNELS,)),
+                          ('output', np.int16, (max_block * OUTPUT_CHANNELS,))], align=True)
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=8 + slots * dtype.itemsize)
+        self.name = self.shm.name
+        self.slots = slots
+        self.count = np.ndarray((1,), dtype=np.uint64, buffer=self.shm.buf)
+        data = np.ndarray((slots,), dtype=dtype, buffer=self.shm.buf, offset=8)
+        self.seq, self.lengths, self.input, self.output = data['seq'], data['lengths'], data['input'], data['output']
+
+    def push(self, data_in, data_out):
+        count = int(self.count[0])
+        slot = count % self.slots
+        data_in, data_out = data_in[:self.input.shape[1]], data_out[:self.output.shape[1]]
+        self.seq[slot] = 2 * count + 1
+        self.lengths[slot] = (len(data_in), len(data_out))
+        self.input[slot, :len(data_in)] = data_in
+        self.output[slot, :len(data_out)] = data_out
+        self.seq[slot] = 2 * count + 2
+        self.count[0] = count + 1
+
+    def latest(self):
+        count = int(self.count[0])
+        for index in range(count - 1, max(count - self.slots, 0) - 1, -1):
+            slot = index % self.slots
+            if self.seq[slot] != 2 * index + 2:
+                continue
+            n_in, n_out = self.lengths[slot]
+            data_in, data_out = self.input[slot, :n_in].copy(), self.output[slot, :n_out].copy()
+            if self.seq[slot] == 2 * index + 2:
+                return data_in, data_out
+        return None
+
+    def close(self, unlink=False):
+        self.count = self.seq = self.lengths = self.input = self.output = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+# Componenta a procesorului din procesul audio: apelurile de metode devin comenzi in coada, fara rezultat
+class RemoteComponent:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def __getattr__(self, method):
+        if method.startswith('_'):
+            raise AttributeError(method)
+        return functools.partial(self.client.send, self.name, method)
+
+# Lantul DSP validat pe starea raportata de procesul audio, cu aceleasi exceptii ca DSPChain
+class RemoteChain(RemoteComponent):
+    def info(self):
+        return self.client.status.get('chain', {'stages': [], 'latency_samples': 0})
+
+    def names(self):
+        return [stage['name'] for stage in self.info()['stages']]
+
+    def configure(self, name, enabled=None, bypass=None):
+        if name not in self.names():
+            raise KeyError(name)
+        self.client.send('chain', 'configure', name, enabled, bypass)
+
+    def reorder(self, names):
+        if sorted(names) != sorted(self.names()):
+            raise ValueError(f"Ordinea trebuie sa contina exact etapele: {self.names()}")
+        self.client.send('chain', 'reorder', list(names))
+
+# Inlocuieste AudioProcessor in procesul web cand AUDIO_PROCESS este activ. params ajung in procesul audio
+# prin AudioControlBlock, comenzile rare (etape DSP, EQ, limitator) printr-o coada, iar starea (lant DSP,
+# latenta, health, log-uri) revine o data pe secunda. Nicio operatie din procesul web nu asteapta audio-ul.
+class AudioEngineClient:
+    def __init__(self):
+        context = multiprocessing.get_context('spawn')
+        self.control = AudioControlBlock(OUTPUT_CHANNELS)
+        self.meters = MeterRing(AUDIO_METER_SLOTS, ADAPTIVE_MAX_CHUNK if ADAPTIVE_BUFFER else CHUNK)
+        self.commands = context.Queue()
+        self.updates = context.Queue()
+        self.status = {}
+        self.ready = threading.Event()
+        self.running = False
+        self.closed = False
+        self.chain = RemoteChain(self, 'chain')
+        self.eq = RemoteComponent(self, 'eq')
+        self.limiter = RemoteComponent(self, 'limiter')
+        self.process = context.Process(target=run_audio_process, name='audio', daemon=True,
+                                       args=(audio_process_config(), self.control.name, self.meters.name, self.commands, self.updates))
+        self.monitor_thread = None
+
+    def start(self):
+        self.running = True
+        self.publish()
+        self.process.start()
+        self.monitor_thread = threading.Thread(target=self.monitor, daemon=True)
+        self.monitor_thread.start()
+        if not self.ready.wait(AUDIO_PROCESS_START_TIMEOUT_S) or 'error' in self.status or not self.process.is_alive():
+            error = self.status.get('error', "procesul nu a raspuns")
+            self.cleanup()
+            raise RuntimeError(f"Procesul audio nu a pornit: {error}")
+        log_debug("audio", f"Proces audio pornit, pid {self.process.pid}")
+
+    def publish(self):
+        self.control.publish(params, self.running)
+
+    def send(self, component, method, *args):
+        self.commands.put((component, method, args))
+
+    def monitor(self):
+        while self.process.is_alive():
+            try:
+                update = self.updates.get(timeout=0.1)
+            except queue.Empty:
+                update = None
+            if update is not None:
+                for name, entries in update.pop('logs', {}).items():
+                    target = globals()[name]
+                    target.extend(entries)
+                    del target[:-100]
+                self.status.update(update)
+                self.ready.set()
+            record = self.meters.latest()
+            if record is not None:
+                emit_audio_levels(*record)
+        if self.running:
+            log_debug("audio", f"Procesul audio s-a oprit neasteptat, cod {self.process.exitcode}")
+        self.ready.set()
+
+    def latency_info(self):
+        return self.status.get('latency', {'adaptive': ADAPTIVE_BUFFER, 'block_size': 0, 'total_latency_ms': 0})
+
+    def health_info(self):
+        return {**self.status.get('health', {}), 'process': {'pid': self.process.pid, 'alive': self.process.is_alive(),
+                                                             'exitcode': self.process.exitcode}}
+
+    def stop(self):
+        if self.running:
+            log_debug("audio", "Opresc procesul audio...")
+            self.running = False
+            self.publish()
+        if self.process.pid is not None:
+            self.process.join(timeout=2.0)
+            if self.process.is_alive():
+                log_debug("audio", "Procesul audio nu s-a oprit in timp util, il termin")
+                self.process.terminate()
+                self.process.join(timeout=1.0)
+
+    def cleanup(self):
+        if self.closed:
+            return
+        self.stop()
+        if self.monitor_thread is not None:
+            self.monitor_thread.join(timeout=1.0)
+        self.closed = True
+        self.meters.close(unlink=True)
+        self.control.close(unlink=True)
+        log_debug("audio", "Cleanup proces audio complet")
+
+def publish_params():
+    current_processor = processor
+    if isinstance(current_processor, AudioEngineClient):
+        current_processor.publish()
+
+# Setarile trimise procesului audio: doar configurare, niciodata stare de executie (porturi, cozi, log-uri)
+AUDIO_PROCESS_CONFIG = (
+    'CHANNELS', 'RATE', 'CHUNK', 'MAX_DELAY_MS', 'OUTPUT_LAYOUT', 'OUTPUT_CHANNELS', 'MAX_DELAY_SAMPLES',
+    'FRACTIONAL_DELAY_ORDER', 'FRACTIONAL_DELAY_STEPS', 'DELAY_TRANSITION', 'DELAY_TRANSITION_SAMPLES',
+    'EQ_BANDS', 'LIMITER_CEILING_DB', 'LIMITER_ATTACK_MS', 'LIMITER_MAX_ATTACK_MS', 'LIMITER_RELEASE_MS', 'HRIR_FILE',
+    'AUDIO_IO_MODE', 'CALLBACK_DSP', 'AUDIO_RING_BLOCKS', 'AUDIO_RING_PREFILL',
+    'ADAPTIVE_BUFFER', 'ADAPTIVE_MIN_CHUNK', 'ADAPTIVE_MAX_CHUNK', 'ADAPTIVE_HIGH_LOAD', 'ADAPTIVE_LOW_LOAD',
+    'ADAPTIVE_SETTLE_S', 'ADAPTIVE_DOWN_HOLD_S', 'ADAPTIVE_MAX_HOLD_S', 'AUDIO_HEALTH_EVENTS',
+    'AUDIO_CPU_AFFINITY', 'AUDIO_SCHED_POLICY', 'AUDIO_SCHED_PRIORITY', 'AUDIO_METER_SLOTS', 'CONTROL_READ_RETRIES',
+    'RECOVERY_BASE_DELAY_S', 'RECOVERY_MAX_DELAY_S', 'RECOVERY_INCIDENTS',
+    'AUDIO_BACKEND', 'AUDIO_BACKEND_SPEED', 'AUDIO_INPUT_FILE', 'AUDIO_INPUT_LOOP', 'AUDIO_OUTPUT_FILE', 'SYNTHETIC_SIGNAL',
+    'DRIFT_COMPENSATION', 'DRIFT_MAX_PPM', 'DRIFT_KP', 'DRIFT_KI', 'DRIFT_SMOOTHING_S', 'DRIFT_SETTLE_S',
+    'INPUT_DEVICE_MATCH', 'OUTPUT_DEVICE_MATCH', 'ASOUND_CARDS_PATH', 'DEVICE_POLL_S', 'DSP_CHAIN_SETTINGS'
+)
+
+def audio_process_config():
+    # procesul audio reimporta modulul, deci primeste configurarea curenta, inclusiv ce s-a schimbat prin API
+    return {name: globals()[name] for name in AUDIO_PROCESS_CONFIG}
+
+def audio_devices_info():
+    return {**DEVICE_REGISTRY.snapshot(), 'input': LOOPBACK_DEVICE_INDEX, 'output': IQAUDIO_DEVICE_INDEX,
+            'input_match': INPUT_DEVICE_MATCH, 'output_match': OUTPUT_DEVICE_MATCH}
+
+def run_audio_process(config, control_name, meters_name, commands, updates):
+    # punctul de intrare al procesului audio: in el procesorul ruleaza local, ca in modul cu un singur proces
+    global processor, p_proc, SHOULD_RUN
+    globals().update(config, AUDIO_PROCESS=False)
+    control = AudioControlBlock(OUTPUT_CHANNELS, control_name)
+    meters = MeterRing(AUDIO_METER_SLOTS, ADAPTIVE_MAX_CHUNK if ADAPTIVE_BUFFER else CHUNK, meters_name)
+    while not control.read(params):
+        time.sleep(0.001)
+    try:
+        p_proc = create_audio_backend()
+        processor = AudioProcessor(p_proc)
+    except Exception as e:
+        updates.put({'error': str(e)})
+        control.close()
+        meters.close()
+        return
+    processor.control = control
+    processor.meters = meters
+    SHOULD_RUN = True
+    processor.start()
+    if AUDIO_BACKEND == 'pyaudio':
+        threading.Thread(target=monitor_audio_devices, daemon=True).start()
+    parent = multiprocessing.parent_process()
+    last_update = 0
+    while control.running() and parent.is_alive():
+        try:
+            component, method, args = commands.get(timeout=0.1)
+        except queue.Empty:
+            component = None
+        if component is not None:
+            try:
+                getattr(getattr(processor, component), method)(*args)
+            except Exception as e:
+                log_debug("audio", f"Comanda {component}.{method} esuata: {e}")
+        if time.time() - last_update >= 1.0:
+            logs = {}
+            for name in ('AUDIO_LOGS', 'GENERAL_LOGS'):
+                entries = globals()[name]
+                n = len(entries)
+                logs[name] = entries[:n]
+                del entries[:n]
+            updates.put({'chain': processor.chain.info(), 'latency': processor.latency_info(), 'health': processor.health_info(),
+                         'devices': audio_devices_info(), 'logs': logs})
+            last_update = time.time()
+    SHOULD_RUN = False
+    processor.stop()
+    processor.cleanup()
+    p_proc.terminate()
+    processor = p_proc = None
+    control.close()
+    meters.close()
+
 def start_processing():
     global processor, SHOULD_RUN, p_proc
     with PROCESSOR_LOCK:
@@ -444,17 +2936,14 @@ def start_processing():
             except Exception as e:
                 log_debug("general", f"Eroare la cleanup: {e}")
             processor = None
-        if p_proc:
-            try:
-                p_proc.terminate()
-                log_debug("general", "PyAudio anterior terminat")
-            except Exception as e:
-                log_debug("general", f"Eroare la terminarea PyAudio: {e}")
-            p_proc = None
-        time.sleep(0.5)
         try:
-            p_proc = pyaudio.PyAudio()
-            processor = AudioProcessor(p_proc)
+            # instanta PyAudio ramane deschisa intre porniri; se recreeaza doar dupa o pornire esuata
+            if AUDIO_PROCESS:
+                processor = AudioEngineClient()
+            else:
+                if p_proc is None:
+                    p_proc = create_audio_backend()
+                processor = AudioProcessor(p_proc)
             SHOULD_RUN = True
             processor.start()
             log_debug("general", "Procesare audio pornita!")
@@ -520,6 +3009,11 @@ def websocket_data_thread():
                 'wifi_power': signal
             }
             socketio.emit('logs', logs)
+            current_processor = processor
+            if current_processor is not None:
+                socketio.emit('dsp', current_processor.chain.info())
+                socketio.emit('audio_latency', current_processor.latency_info())
+                socketio.emit('audio_health', current_processor.health_info())
             LAST_LOGS_UPDATE = current_time
         socketio.emit('params', params)
         socketio.sleep(0.01)
@@ -529,10 +3023,38 @@ def watchdog():
     while True:
         if not serial_thread.is_alive():
             log_debug("general", "Serial thread oprit, repornesc...")
-            serial_thread = threading.Thread(target=read_serial, daemon=True)
+            serial_thread = threading.Thread(target=sensor_reader(), daemon=True)
             serial_thread.start()
         time.sleep(5)
 
+def monitor_audio_devices():
+    # hot-plug: o instanta PyAudio noua vede placile noi doar daca nicio alta instanta nu mai e deschisa
+    # (Pa_Initialize doar incrementeaza contorul de referinte). Cu procesorul pornit, thread-ul audio inchide
+    # instanta veche si re-enumereaza intre doua blocuri; fara procesor, schimbul se face aici sub PROCESSOR_LOCK
+    global p_proc
+    while True:
+        time.sleep(DEVICE_POLL_S)
+        if AUDIO_BACKEND != 'pyaudio' or AUDIO_PROCESS or not DEVICE_REGISTRY.cards_changed():
+            continue
+        log_debug("audio", f"Placi de sunet schimbate: {DEVICE_REGISTRY.read_cards()}, re-enumerez dispozitivele")
+        with PROCESSOR_LOCK:
+            current_processor = processor
+            if current_processor is None:
+                try:
+                    if p_proc is not None:
+                        old, p_proc = p_proc, None
+                        old.terminate()
+                    p_proc = create_audio_backend()
+                    DEVICE_REGISTRY.refresh(p_proc)
+                except Exception as e:
+                    log_debug("audio", f"Eroare la re-enumerarea dispozitivelor: {e}")
+                continue
+        done = current_processor.request_device_switch()
+        if not done.wait(timeout=5.0):
+            log_debug("audio", "Re-enumerarea dispozitivelor nu s-a terminat in 5 s")
+            continue
+        log_debug("audio", f"Dispozitive re-enumerate: intrare {LOOPBACK_DEVICE_INDEX}, iesire {IQAUDIO_DEVICE_INDEX}")
+
 def cleanup():
     global processor, ser, p_proc, SHOULD_RUN
     log_debug("general", "Incep cleanup global...")
@@ -556,6 +3078,8 @@ def cleanup():
         if ser and ser.is_open:
             ser.close()
             log_debug("general", "Port serial inchis")
+        for node in sensor_nodes:
+            node.close()
     except Exception as e:
         log_debug("general", f"Eroare la inchiderea serial: {e}")
 
@@ -563,7 +3087,7 @@ atexit.register(cleanup)
 
 @app.route('/toggle', methods=['POST'])
 def toggle_processing():
-    global SHOULD_RUN, processor, p_proc
+    global SHOULD_RUN, processor
     log_debug("general", f"Inainte de toggle: running = {params['running']}")
     try:
         if params['running']:
@@ -579,14 +3103,6 @@ def toggle_processing():
                     except Exception as e:
                         log_debug("general", f"Eroare la oprirea procesorului: {e}")
                     processor = None
-                if p_proc:
-                    try:
-                        p_proc.terminate()
-                        log_debug("general", "PyAudio terminat")
-                    except Exception as e:
-                        log_debug("general", f"Eroare la terminarea p_proc: {e}")
-                    p_proc = None
-            time.sleep(1.0)
             log_debug("general", "Procesare oprit complet")
         else:
             log_debug("general", "Pornesc procesarea...")
@@ -614,6 +3130,114 @@ def get_audio_logs():
 def get_general_logs():
     return jsonify({'logs': GENERAL_LOGS})
 
+@app.route('/serial/stats', methods=['GET'])
+def get_serial_stats():
+    now = time.monotonic()
+    return jsonify({**SERIAL_FRAMER.stats, 'buffered': len(SERIAL_FRAMER.buffer), 'port': ser.port if ser else None,
+                    'nodes': [{**node.info(now), 'stats': node.framer.stats} for node in sensor_nodes]})
+
+@app.route('/dsp/stages', methods=['GET'])
+def get_dsp_stages():
+    current_processor = processor
+    if current_processor is None:
+        return jsonify({'stages': [], 'latency_samples': 0, 'settings': DSP_CHAIN_SETTINGS})
+    return jsonify({**current_processor.chain.info(), 'settings': DSP_CHAIN_SETTINGS})
+
+@app.route('/dsp/stages/<name>', methods=['POST'])
+def configure_dsp_stage(name):
+    data = request.get_json(silent=True) or {}
+    flags = {key: bool(data[key]) for key in ('enabled', 'bypass') if key in data}
+    current_processor = processor
+    try:
+        if name not in DSP_STAGE_NAMES:
+            raise KeyError(name)
+        if current_processor is not None:
+            current_processor.chain.configure(name, flags.get('enabled'), flags.get('bypass'))
+    except KeyError:
+        return jsonify({'status': 'error', 'message': f"Etapa DSP necunoscuta: {name}"}), 404
+    DSP_CHAIN_SETTINGS['stages'].setdefault(name, {}).update(flags)
+    log_debug("audio", f"Etapa DSP {name} configurata: {flags}")
+    return jsonify({'status': 'success', 'stage': name, **flags})
+
+@app.route('/dsp/order', methods=['POST'])
+def reorder_dsp_stages():
+    data = request.get_json(silent=True) or {}
+    order = data.get('order')
+    if not isinstance(order, list):
+        return jsonify({'status': 'error', 'message': "Lipseste lista 'order'"}), 400
+    current_processor = processor
+    try:
+        check_dsp_order(order)
+        if current_processor is not None:
+            current_processor.chain.reorder(order)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    DSP_CHAIN_SETTINGS['order'] = list(order)
+    log_debug("audio", f"Ordinea etapelor DSP: {order}")
+    return jsonify({'status': 'success', 'order': order})
+
+@app.route('/audio/latency', methods=['GET'])
+def get_audio_latency():
+    current_processor = processor
+    if current_processor is None:
+        return jsonify({'adaptive': ADAPTIVE_BUFFER, 'block_size': 0, 'total_latency_ms': 0})
+    return jsonify(current_processor.latency_info())
+
+@app.route('/audio/devices', methods=['GET'])
+def get_audio_devices():
+    current_processor = processor
+    if isinstance(current_processor, AudioEngineClient) and 'devices' in current_processor.status:
+        return jsonify(current_processor.status['devices'])
+    return jsonify(audio_devices_info())
+
+@app.route('/audio/health', methods=['GET'])
+def get_audio_health():
+    current_processor = processor
+    if current_processor is None:
+        return jsonify({'counters': {kind: 0 for kind in AUDIO_EVENT_TYPES}, 'xruns': 0, 'uptime_s': 0, 'events': [], 'recovery': None, 'scheduling': {}})
+    return jsonify(current_processor.health_info())
+
+@app.route('/eq', methods=['GET'])
+def get_eq():
+    return jsonify({'bands': EQ_BANDS, 'backend': 'scipy' if scipy_signal is not None else 'numpy'})
+
+@app.route('/eq', methods=['POST'])
+def set_eq():
+    global EQ_BANDS
+    data = request.get_json(silent=True) or {}
+    bands = data.get('bands')
+    if not isinstance(bands, list):
+        return jsonify({'status': 'error', 'message': "Lipseste lista 'bands'"}), 400
+    try:
+        for band in bands:
+            design_biquad(band)
+        current_processor = processor
+        if current_processor is not None:
+            current_processor.eq.set_bands(bands)
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': f"Banda EQ invalida: {e}"}), 400
+    EQ_BANDS = bands
+    log_debug("audio", f"EQ actualizat: {len(bands)} benzi")
+    return jsonify({'status': 'success', 'bands': EQ_BANDS})
+
+@app.route('/limiter', methods=['POST'])
+def set_limiter():
+    global LIMITER_CEILING_DB, LIMITER_RELEASE_MS
+    data = request.get_json(silent=True) or {}
+    try:
+        ceiling_db = float(data.get('ceiling_db', LIMITER_CEILING_DB))
+        release_ms = float(data.get('release_ms', LIMITER_RELEASE_MS))
+    except (TypeError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': f"Parametri limitator invalizi: {e}"}), 400
+    if release_ms <= 0:
+        return jsonify({'status': 'error', 'message': "release_ms trebuie sa fie pozitiv"}), 400
+    LIMITER_CEILING_DB, LIMITER_RELEASE_MS = min(ceiling_db, 0.0), release_ms
+    current_processor = processor
+    if current_processor is not None:
+        current_processor.limiter.set_params(LIMITER_CEILING_DB, LIMITER_RELEASE_MS)
+    log_debug("audio", f"Limitator: ceiling={LIMITER_CEILING_DB} dB, release={LIMITER_RELEASE_MS} ms")
+    return jsonify({'status': 'success', 'ceiling_db': LIMITER_CEILING_DB, 'release_ms': LIMITER_RELEASE_MS})
+
 @socketio.on('connect')
 def handle_connect():
     log_debug("general", "Client conectat!")
@@ -633,10 +3257,12 @@ def handle_disconnect():
 if __name__ == '__main__':
     log_debug("general", "Pornirea aplicatiei...")
     try:
-        serial_thread = threading.Thread(target=read_serial, daemon=True)
+        serial_thread = threading.Thread(target=sensor_reader(), daemon=True)
         serial_thread.start()
         watchdog_thread = threading.Thread(target=watchdog, daemon=True)
         watchdog_thread.start()
+        device_thread = threading.Thread(target=monitor_audio_devices, daemon=True)
+        device_thread.start()
         socketio.start_background_task(websocket_data_thread)
         log_debug("general", "Pornirea serverului Flask pe http://0.0.0.0:5500")
         socketio.run(app, host='0.0.0.0', port=5500, debug=True)